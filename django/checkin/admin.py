@@ -4,7 +4,7 @@ import logging
 
 from django.contrib import admin
 
-from .models import Workday, WorkdayOption, Profile, DayOff
+from .models import Workday, WorkdayOption, Profile, DayOff, RosterEntry
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +73,11 @@ class ProfileAdmin(admin.ModelAdmin):
     # list view
     list_display = ('__str__', 'available_flex_days', 'available_vacation_days', 'available_sick_days')
 
+    def get_queryset(self, request):
+        # the balances are read three times per row
+        qs = super(ProfileAdmin, self).get_queryset(request)
+        return qs.select_related('user').prefetch_related('balances')
+
 
 class WorkdayOptionAdmin(admin.ModelAdmin):
     icon='<i class="material-icons">playlist_add_check</i>'
@@ -118,9 +123,26 @@ class WorkdayAdmin(admin.ModelAdmin):
         return self.readonly_fields
 
 
+class RosterEntryAdmin(admin.ModelAdmin):
+    '''
+    The statuses worked out ahead of each check-in (see checkin.tasks.build_daily_roster)
+    '''
+    icon='<i class="material-icons">event_available</i>'
+    date_hierarchy = "date"
+
+    list_display = ('date', 'user', 'option', 'projects', 'updated')
+    list_filter = ('date', 'option')
+    readonly_fields = ('date', 'user', 'option', 'projects', 'updated')
+
+    def get_queryset(self, request):
+        qs = super(RosterEntryAdmin, self).get_queryset(request)
+        return qs.select_related('user__user', 'option')
+
+
 # Register in order of usefullness
 
 admin.site.register(Workday, WorkdayAdmin)
 admin.site.register(DayOff,DayOffAdmin)
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(WorkdayOption, WorkdayOptionAdmin) 
+admin.site.register(RosterEntry, RosterEntryAdmin)
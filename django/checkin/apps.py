@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import logging
+
 from django.apps import AppConfig
 
 
 class CheckinConfig(AppConfig):
+    logger = logging.getLogger(__name__)
     name = 'checkin'
     verbose_name = "Check-In Bot"
     icon='<i class="material-icons">alarm_on</i>'
+
+    def ready(self):
+        self.logger.info("Importing signals")
+        from checkin import signals
@@ -0,0 +1,30 @@
+'''
+Recounts every user's working streak from their workdays
+
+usage: python manage.py rebuild_streaks [--user username ...]
+'''
+from django.core.management.base import BaseCommand
+
+from checkin.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the stored working streak used for the 7 day flex bonus"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='usernames',
+            help="Only rebuild this user's streak. Can be given more than once",
+        )
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.select_related('user')
+        if options['usernames']:
+            profiles = profiles.filter(user__username__in=options['usernames'])
+
+        for profile in profiles:
+            profile.rebuild_streak()
+            self.stdout.write("{}: {} working day(s) as of {}".format(
+                profile, profile.working_streak, profile.streak_date))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 10:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0006_auto_20190121_1151'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeOffBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_off_type', models.CharField(choices=[('vacation', 'Vacation'), ('sick', 'Sick'), ('flex', 'Flex')], max_length=100)),
+                ('accrued', models.FloatField(default=0)),
+                ('used', models.FloatField(default=0)),
+                ('as_of', models.DateField(blank=True, null=True, verbose_name='Computed for')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='checkin.Profile')),
+            ],
+            options={
+                'verbose_name': 'Time Off Balance',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='timeoffbalance',
+            unique_together=set([('user', 'time_off_type')]),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 11:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import arrow
+
+
+def schedule_from_timezone(apps, schema_editor):
+    '''
+    moves everyone onto the check-in dispatcher, and removes the
+    per-user periodic tasks it replaces
+    '''
+    Profile = apps.get_model('checkin', 'Profile')
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    CrontabSchedule = apps.get_model('django_celery_beat', 'CrontabSchedule')
+
+    task_ids = []
+    for profile in Profile.objects.all():
+        if profile.daily_task_id is not None:
+            task_ids.append(profile.daily_task_id)
+
+        if profile.timezone:
+            server_time = arrow.now(profile.timezone).replace(
+                hour=profile.start_time.hour,
+                minute=profile.start_time.minute,
+                second=profile.start_time.second).to('UTC')
+            profile.checkin_minute = server_time.hour * 60 + server_time.minute
+
+        # unlink first, deleting the task would cascade to the profile
+        profile.daily_task = None
+        profile.save()
+
+    crontab_ids = list(PeriodicTask.objects.filter(pk__in=task_ids).values_list('crontab_id', flat=True))
+    PeriodicTask.objects.filter(pk__in=task_ids).delete()
+    CrontabSchedule.objects.filter(pk__in=crontab_ids, periodictask__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0007_timeoffbalance'),
+        ('django_celery_beat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='checkin_minute',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, help_text='Minutes after midnight UTC, kept up to date from the timezone and start time', null=True, verbose_name='Daily Check-in Time (UTC)'),
+        ),
+        migrations.RunPython(schedule_from_timezone, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='profile',
+            name='daily_task',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 12:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0008_profile_checkin_minute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='slack_dm_channel',
+            field=models.CharField(blank=True, default='', help_text="The check-in bot's direct message channel with this user. Filled in automatically.", max_length=50, verbose_name='Slack DM Channel'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 13:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0009_profile_slack_dm_channel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='streak_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Last Day Counted In Streak'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='working_streak',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Working Days In A Row'),
+        ),
+    ]
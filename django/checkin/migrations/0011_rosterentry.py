@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 16:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0010_profile_working_streak'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RosterEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('projects', models.CharField(blank=True, default='', help_text='Comma separated ids of the projects the user is on site for', max_length=500)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('option', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='checkin.WorkdayOption', verbose_name='Status')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='roster', to='checkin.Profile')),
+            ],
+            options={
+                'verbose_name': 'Roster Entry',
+                'verbose_name_plural': 'Roster',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='rosterentry',
+            unique_together=set([('date', 'user')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 18:02
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def seed_dispatch(apps, schema_editor):
+    '''
+    the one row the dispatchers lock, starting from the minute before now
+    '''
+    CheckinDispatch = apps.get_model('checkin', 'CheckinDispatch')
+    last_minute = timezone.now().replace(second=0, microsecond=0) - datetime.timedelta(minutes=1)
+    CheckinDispatch.objects.create(pk=1, last_minute=last_minute)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0011_rosterentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckinDispatch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_minute', models.DateTimeField(verbose_name='Last Dispatched Minute (UTC)')),
+            ],
+        ),
+        migrations.RunPython(seed_dispatch, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 19:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+import arrow
+
+
+def rebuild_streaks(apps, schema_editor):
+    '''
+    counts everyone's working streak from their past workdays, the same way as
+    Profile.rebuild_streak(), so the 7 day flex bonus carries on where it was
+    '''
+    Profile = apps.get_model('checkin', 'Profile')
+    Workday = apps.get_model('checkin', 'Workday')
+
+    since = arrow.now().shift(years=-1).date()
+
+    for profile in Profile.objects.all():
+        responses = Workday.objects.filter(
+                user=profile,
+                date__gte=since,
+                response__isnull=False,
+            ).order_by('-date').values_list('date', 'response__time_off_type')
+
+        working_count = 0
+        streak_date = None
+        for date, time_off_type in responses:
+            if streak_date is None:
+                streak_date = date
+            if time_off_type is None:
+                # working day
+                working_count += 1
+            else:
+                break
+
+        Profile.objects.filter(pk=profile.pk).update(
+            working_streak=working_count,
+            streak_date=streak_date,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0012_checkindispatch'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_streaks, migrations.RunPython.noop),
+    ]
@@ -8,10 +8,12 @@ import math
 
 import pytz
 
-from django.db import models
-from django.db.models import Sum, Count, Q, Case, When
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Sum, Count, Q, Case, When, F
 from django.contrib.auth.models import User
-from django_celery_beat.models import PeriodicTask
+
+from lucid_api.services.cache import TTLCache
 
 TIME_OFF_TYPES = [
     ('vacation', 'Vacation'),
@@ -21,6 +23,53 @@ TIME_OFF_TYPES = [
 
 TIMEZONES = [(tz, tz) for tz in pytz.all_timezones]
 
+
+def time_off_window(time_off_type, today):
+    '''
+    returns a Q filter on *date* for the days that count towards *time_off_type*'s
+    balance on *today*
+    '''
+    filters = dict(
+        # flex days are good for 1 year
+        flex=Q(date__gte=arrow.get(today).shift(years=-1).date()),
+        # vacation never expires
+        vacation=Q(date__lte=today),
+        # sick days reset each year
+        sick=Q(date__year=today.year)
+    )
+    return filters[time_off_type]
+
+
+def utc_checkin_minute(timezone, start_time):
+    '''
+    returns when *start_time* in *timezone* falls today, as minutes after
+    midnight UTC. This moves with DST, so it's refreshed every night by
+    checkin.tasks.update_user_timezones.
+    '''
+    if not timezone:
+        return None
+
+    user_time = arrow.now(timezone).replace(
+        hour=start_time.hour,
+        minute=start_time.minute,
+        second=start_time.second)
+    server_time = user_time.to('UTC')
+
+    return server_time.hour * 60 + server_time.minute
+
+
+def in_time_off_window(time_off_type, date, today):
+    '''
+    same rules as time_off_window(), for a single *date*
+    '''
+    if time_off_type == 'flex':
+        return date >= arrow.get(today).shift(years=-1).date()
+    if time_off_type == 'vacation':
+        return date <= today
+    if time_off_type == 'sick':
+        return date.year == today.year
+    return False
+
 class Profile(models.Model):
     '''
     Profile for a Checkin user. Has a one-to-one relationship to a django.contrib.auth User
@@ -37,6 +86,13 @@ class Profile(models.Model):
         verbose_name="Slack Member ID",
         help_text="This should be something like <strong>U1ADJNUJX</strong>"
     )
+    slack_dm_channel = models.CharField(
+        max_length=50,
+        blank=True,
+        default="",
+        verbose_name="Slack DM Channel",
+        help_text="The check-in bot's direct message channel with this user. Filled in automatically.",
+    )
     timezone = models.CharField(
         max_length=200,
         blank=True,
@@ -47,71 +103,198 @@ class Profile(models.Model):
         blank=False,
         default=datetime.time(9,1)
     )
-    daily_task = models.OneToOneField(
-        PeriodicTask,
-        on_delete=models.CASCADE,
-        related_name="profile",
-        verbose_name="Daily Check-in Schedule",
+    checkin_minute = models.PositiveSmallIntegerField(
+        verbose_name="Daily Check-in Time (UTC)",
+        help_text="Minutes after midnight UTC, kept up to date from the timezone and start time",
+        editable=False,
         blank=True,
-        null=True
+        null=True,
+        db_index=True,
     )
     is_active = models.BooleanField(
         default=True,
     )
+    working_streak = models.PositiveIntegerField(
+        verbose_name="Working Days In A Row",
+        default=0,
+        editable=False,
+    )
+    streak_date = models.DateField(
+        verbose_name="Last Day Counted In Streak",
+        blank=True,
+        null=True,
+        editable=False,
+    )
 
     def __str__(self):
         return self.user.get_username()
 
+    def save(self, *args, **kwargs):
+        self.checkin_minute = utc_checkin_minute(self.timezone, self.start_time)
+        super(Profile, self).save(*args, **kwargs)
+
     def days(self, time_off_type):
         '''
         determines the number of available days of *time_off_type*
+
+        Reads the cached TimeOffBalance, which is kept up to date by the signals
+        in checkin.signals and recomputed once a day for the rolling windows.
+        Prefetch *balances* to read several users without any queries.
+
+        ###Returns:
+        A tuple of (`accrued`, `used`)
+        '''
+        today = arrow.now().date()
+        balance = self._get_balance(time_off_type)
+
+        if balance is None or balance.as_of != today:
+            balance = self.refresh_balance(time_off_type, balance=balance, today=today)
+
+        return balance.accrued, balance.used
+
+    def refresh_balance(self, time_off_type, balance=None, today=None):
+        '''
+        recomputes the TimeOffBalance of *time_off_type* from the user's workdays
+        and accrued days off
+
+        The row is locked while counting, so a Workday or DayOff change that
+        lands meanwhile (see checkin.signals) waits and is applied on top,
+        instead of being overwritten or missed.
+        '''
+        if today is None:
+            today = arrow.now().date()
+
+        with transaction.atomic():
+            if balance is None:
+                balance, _ = TimeOffBalance.objects.get_or_create(user=self, time_off_type=time_off_type)
+            balance = TimeOffBalance.objects.select_for_update().get(pk=balance.pk)
+
+            try:
+                # get time off used
+                # use filter per type
+                used = self.workdays.filter(time_off_window(time_off_type, today)).aggregate(
+                    days=Sum(Case(
+                        When( response__time_off_type=time_off_type, then='response__time_off_adjustment' ),
+                        output_field=models.FloatField()
+                    ))
+                )['days']
+                # check for none value
+                if used is None: raise ValueError
+            except ValueError:
+                used = 0
+
+            try:
+                # get accrued time off
+                # use filter per type
+                accrued = self.accrued_days_off.filter(time_off_window(time_off_type, today)).aggregate(
+                    days=Sum(Case(
+                        When( type=time_off_type, then='amount' ),
+                        output_field=models.FloatField()
+                    ))
+                )['days']
+                # check for none value
+                if accrued is None: raise ValueError
+            except ValueError:
+                accrued = 0
+
+            balance.accrued = accrued
+            balance.used = used
+            balance.as_of = today
+            balance.save()
+
+        return balance
+
+    def record_workday(self, date, is_working):
         '''
-        filters = dict(
-            # flex days are good for 1 year
-            flex=Q(date__gte=arrow.now().shift(years=-1).date()),
-            # vacation never expires
-            vacation=Q(date__lte=arrow.now().date()),
-            # sick days reset each year
-            sick=Q(date__year=arrow.now().year)
+        updates the working streak with the response to the workday on *date*.
+
+        Responses for the newest day are applied in place. A change to an older
+        day, or a day that goes from time off to working, can't be worked out
+        from the counter alone and falls back to rebuild_streak()
+        '''
+        if self.streak_date is not None and date < self.streak_date:
+            return self.rebuild_streak()
+
+        if self.streak_date == date:
+            if not is_working:
+                streak = 0
+            elif self.working_streak > 0:
+                # swapped one working option for another
+                return
+            else:
+                return self.rebuild_streak()
+        else:
+            streak = self.working_streak + 1 if is_working else 0
+
+        self.working_streak = streak
+        self.streak_date = date
+        Profile.objects.filter(pk=self.pk).update(
+            working_streak=self.working_streak,
+            streak_date=self.streak_date,
+        )
+
+    def rebuild_streak(self):
+        '''
+        recounts the working streak from the user's workdays over the last year
+        '''
+        recent = self.workdays.filter(
+                date__gte=arrow.now().shift(years=-1).date(),
+                response__isnull=False,
+            ).order_by('-date').select_related('response')
+
+        # look through the days and break when we get a non-working one
+        working_count = 0
+        streak_date = None
+        for day in recent:
+            if streak_date is None:
+                streak_date = day.date
+            if day.response.time_off_type is None:
+                # working day
+                working_count += 1
+            else:
+                break
+
+        self.working_streak = working_count
+        self.streak_date = streak_date
+        Profile.objects.filter(pk=self.pk).update(
+            working_streak=self.working_streak,
+            streak_date=self.streak_date,
         )
-        
-
-        try:
-            # get time off used
-            # use filter per type
-            used = self.workdays.filter(filters[time_off_type]).aggregate(
-                days=Sum(Case(
-                    When( response__time_off_type=time_off_type, then='response__time_off_adjustment' ),
-                    output_field=models.IntegerField()
-                ))
-            )['days']
-            # check for none value
-            if used is None: raise ValueError
-        except:
-            used = 0
-
-        try:
-            # get accrued time off
-            # use filter per type
-            accrued = self.accrued_days_off.filter(filters[time_off_type]).aggregate(
-                days=Sum(Case(
-                    When( type=time_off_type, then='amount' ),
-                    output_field=models.IntegerField()
-                ))
-            )['days']
-            # check for none value
-            if accrued is None: raise ValueError
-        except:
-            accrued = 0
-
-        return accrued, used
-        
+
+    def _get_balance(self, time_off_type):
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if 'balances' in prefetched:
+            for balance in prefetched['balances']:
+                if balance.time_off_type == time_off_type:
+                    return balance
+            return None
+
+        return self.balances.filter(time_off_type=time_off_type).first()
 
     class Meta():
         verbose_name="Checkin User"
         verbose_name_plural="Users"
 
 
+def with_days_left(button, time_off_type, user):
+    '''
+    returns a copy of an option's *button* that shows *user*'s remaining days of
+    *time_off_type*, or None if they have none left
+    '''
+    accrued, used = user.days(time_off_type)
+    remaining = accrued - used
+    if remaining <= 0:
+        return None
+
+    button = dict(button)
+    button['text'] += " ({:0.0f})".format(math.floor(remaining))
+    return button
+
+
+# the options barely change, but every check-in shows all of them
+_option_cache = TTLCache(getattr(settings, 'WORKDAY_OPTION_TTL', 300))
+
+
 class WorkdayOption(models.Model):
     '''
     Possible options for responses to the workday query
@@ -182,19 +365,6 @@ class WorkdayOption(models.Model):
             style=self.style,
         )
 
-        # check to see if we've supplied a user, and if so, display the number
-        # of available days of this type. Return None if there are no days left.
-        if user is not None and self.time_off_type is not None:
-            accrued, used = user.days(self.time_off_type)
-            remaining = accrued - used
-            if remaining <= 0:
-                # no more of this day type available, return no JSON option
-                return None
-            else:
-                action_button['text'] += " ({:0.0f})".format(
-                    math.floor(accrued-used)
-                    )
-
         if self.require_confirmation:
             action_button['confirm']=dict(
                 title="Are you sure?",
@@ -203,7 +373,52 @@ class WorkdayOption(models.Model):
                 dismiss_text="No"
             )
 
+        # check to see if we've supplied a user, and if so, display the number
+        # of available days of this type. Return None if there are no days left.
+        if user is not None and self.time_off_type is not None:
+            return with_days_left(action_button, self.time_off_type, user)
+
         return action_button
+
+    @classmethod
+    def get_active(cls):
+        '''
+        returns the enabled options in display order, as a tuple of
+        (`option`, `button`) where `button` is the option's as_json() without a
+        user. Cached until an option changes (see signals) or WORKDAY_OPTION_TTL
+        runs out, so treat the buttons as read only.
+        '''
+        return _option_cache.get('active', cls._load_active)
+
+    @classmethod
+    def invalidate_cache(cls):
+        _option_cache.invalidate()
+
+    @classmethod
+    def _load_active(cls):
+        return tuple(
+            (option, option.as_json())
+            for option in cls.objects.filter(is_active=True).order_by('sort_order')
+        )
+
+    @classmethod
+    def actions_for(cls, user):
+        '''
+        the check-in buttons for *user*: the cached buttons, with the user's
+        remaining days merged into the time off ones. Options they have no days
+        left of are left out.
+
+        Prefetch the user's *balances* to do this without any queries.
+        '''
+        actions = []
+        for option, button in cls.get_active():
+            if option.time_off_type is not None:
+                button = with_days_left(button, option.time_off_type, user)
+                if button is None:
+                    continue
+            actions.append(button)
+
+        return actions
     
     def __str__(self):
         return self.name
@@ -317,6 +532,170 @@ class DayOff(models.Model):
         verbose_name = "Day Off"
         verbose_name_plural = "Days Off"
 
+
+class TimeOffBalance(models.Model):
+    '''
+    Cached accrued and used days of one time off type for a user, so reading
+    a balance doesn't have to aggregate every Workday and DayOff.
+
+    Workday and DayOff changes are applied to it as they happen (see
+    checkin.signals). Rows are only current for the date in *as_of*, and
+    Profile.days() recomputes stale rows, which is how days falling out of
+    the rolling windows get dropped.
+    '''
+    user = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="balances",
+    )
+    time_off_type = models.CharField(
+        max_length=100,
+        choices=TIME_OFF_TYPES,
+    )
+    accrued = models.FloatField(
+        default=0,
+    )
+    used = models.FloatField(
+        default=0,
+    )
+    as_of = models.DateField(
+        verbose_name="Computed for",
+        blank=True,
+        null=True,
+    )
+
+    def __str__(self):
+        return "{s.time_off_type} balance for {s.user}".format(s=self)
+
+    @classmethod
+    def adjust(cls, user_id, time_off_type, date, accrued=0, used=0):
+        '''
+        applies a change of *accrued* and/or *used* days on *date* to the user's
+        current balance. Balances that aren't current are left for
+        Profile.days() to recompute.
+
+        *user_id* can also be a list of ids, to apply the same change to
+        several users with one query.
+        '''
+        today = arrow.now().date()
+        if time_off_type is None or not in_time_off_window(time_off_type, date, today):
+            return
+
+        if isinstance(user_id, (list, tuple, set)):
+            users = Q(user_id__in=user_id)
+        else:
+            users = Q(user_id=user_id)
+
+        cls.objects.filter(
+            users,
+            time_off_type=time_off_type,
+            as_of=today,
+        ).update(
+            accrued=F('accrued') + accrued,
+            used=F('used') + used,
+        )
+
+    @classmethod
+    def invalidate(cls, **filters):
+        '''
+        marks balances as stale, so they are recomputed on their next read
+        '''
+        cls.objects.filter(**filters).update(as_of=None)
+
+    class Meta():
+        verbose_name = "Time Off Balance"
+        unique_together = ('user', 'time_off_type')
+
+
+class RosterEntry(models.Model):
+    '''
+    What we already know about a user's status on a day (ie: an On Site task
+    in ftrack), worked out ahead of the check-in by checkin.tasks.build_daily_roster
+    so sending the check-in doesn't have to ask ftrack.
+
+    *option* is empty when the user couldn't be accounted for.
+    '''
+    date = models.DateField(
+        verbose_name="Date",
+    )
+    user = models.ForeignKey(
+        Profile,
+        on_delete=models.CASCADE,
+        related_name="roster",
+    )
+    option = models.ForeignKey(
+        WorkdayOption,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name="Status",
+    )
+    projects = models.CharField(
+        max_length=500,
+        blank=True,
+        default="",
+        help_text="Comma separated ids of the projects the user is on site for",
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+    )
+
+    def __str__(self):
+        return "{s.date} - {s.user} - {status}".format(s=self, status=self.option or "(unknown)")
+
+    @property
+    def project_ids(self):
+        return [int(project_id) for project_id in self.projects.split(",") if project_id]
+
+    @project_ids.setter
+    def project_ids(self, value):
+        self.projects = ",".join("{:d}".format(project_id) for project_id in value)
+
+    class Meta():
+        verbose_name = "Roster Entry"
+        verbose_name_plural = "Roster"
+        unique_together = ('date', 'user')
+
+
+class CheckinDispatch(models.Model):
+    '''
+    The last minute checkin.tasks.dispatch_workday_checkins sent check-ins for,
+    so a late or skipped run catches up on the minutes in between. There's only
+    ever one row, made by the migration that added the model.
+    '''
+    last_minute = models.DateTimeField(
+        verbose_name="Last Dispatched Minute (UTC)",
+    )
+
+    def __str__(self):
+        return "Check-ins sent up to {}".format(self.last_minute)
+
+    @classmethod
+    def claim_minutes(cls, now, catch_up):
+        '''
+        moves the dispatch on to *now*, and returns the minutes that haven't been
+        dispatched yet: everything after the last dispatched minute up to and
+        including *now*, but no more than *catch_up* minutes back.
+
+        The row is locked, so two dispatchers never claim the same minute.
+
+        ###Returns:
+        A list of minutes after midnight UTC (see Profile.checkin_minute)
+        '''
+        now = arrow.get(now).floor('minute')
+        earliest = now.shift(minutes=-catch_up)
+
+        state = cls.objects.select_for_update().get(pk=1)
+
+        start = max(arrow.get(state.last_minute).shift(minutes=+1), earliest)
+        if start > now:
+            return []
+
+        state.last_minute = now.datetime
+        state.save()
+
+        return [minute.hour * 60 + minute.minute for minute in arrow.Arrow.range('minute', start, now)]
+
 # class EffortLog(models.Model):
 #     '''
 #     A log of effort on a project
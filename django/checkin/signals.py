@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+'''
+signals for keeping the check-in bookkeeping up to date
+
+handles :
+- applying Workday responses and DayOff changes to the cached TimeOffBalance
+- counting Workday responses towards the user's working streak
+- dropping the cached check-in options when a WorkdayOption changes
+'''
+from __future__ import unicode_literals
+import logging
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Workday, WorkdayOption, DayOff, TimeOffBalance
+
+logger = logging.getLogger(__name__)
+
+
+def _workday_usage(user_id, date, time_off_type, adjustment):
+    # a workday uses days of its response's time off type, a workday
+    # without a response doesn't use anything
+    return (user_id, date, time_off_type, adjustment or 0)
+
+
+@receiver(pre_save, sender=Workday, dispatch_uid="workday_balance_before")
+def remember_workday_usage(sender, instance, raw, *args, **kwargs):
+    '''
+    keeps what the workday counted for before this save, so the difference
+    can be applied to the balance afterwards
+    '''
+    instance._previous_usage = None
+    instance._previous_response_id = None
+    if raw or instance.pk is None:
+        return
+
+    previous = Workday.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'date', 'response__time_off_type', 'response__time_off_adjustment', 'response_id').first()
+    if previous is not None:
+        instance._previous_usage = _workday_usage(*previous[:4])
+        instance._previous_response_id = previous[4]
+
+
+@receiver(post_save, sender=Workday, dispatch_uid="workday_balance_after")
+def apply_workday_usage(sender, instance, raw, *args, **kwargs):
+    if raw:
+        return
+
+    response = instance.response
+    current = _workday_usage(
+        instance.user_id,
+        instance.date,
+        response.time_off_type if response else None,
+        response.time_off_adjustment if response else 0)
+    previous = getattr(instance, '_previous_usage', None)
+
+    if current == previous:
+        return
+
+    if previous is not None:
+        user_id, date, time_off_type, adjustment = previous
+        TimeOffBalance.adjust(user_id, time_off_type, date, used=-adjustment)
+
+    user_id, date, time_off_type, adjustment = current
+    TimeOffBalance.adjust(user_id, time_off_type, date, used=adjustment)
+
+
+@receiver(post_save, sender=Workday, dispatch_uid="workday_streak")
+def count_workday_streak(sender, instance, raw, *args, **kwargs):
+    '''
+    counts a new or changed response towards the user's working streak
+    '''
+    if raw or instance.response_id is None:
+        return
+
+    if instance.response_id == getattr(instance, '_previous_response_id', None):
+        return
+
+    instance.user.record_workday(instance.date, instance.response.time_off_type is None)
+
+
+@receiver(post_delete, sender=Workday, dispatch_uid="workday_balance_delete")
+def remove_workday_usage(sender, instance, *args, **kwargs):
+    response = instance.response
+    if response is not None:
+        TimeOffBalance.adjust(
+            instance.user_id, response.time_off_type, instance.date,
+            used=-response.time_off_adjustment)
+
+
+@receiver(pre_save, sender=DayOff, dispatch_uid="day_off_balance_before")
+def remember_day_off_accrual(sender, instance, raw, *args, **kwargs):
+    instance._previous_accrual = None
+    if raw or instance.pk is None:
+        return
+
+    previous = DayOff.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'date', 'type', 'amount').first()
+    if previous is not None:
+        instance._previous_accrual = previous
+
+
+@receiver(post_save, sender=DayOff, dispatch_uid="day_off_balance_after")
+def apply_day_off_accrual(sender, instance, raw, *args, **kwargs):
+    if raw:
+        return
+
+    current = (instance.user_id, instance.date, instance.type, instance.amount)
+    previous = getattr(instance, '_previous_accrual', None)
+
+    if current == previous:
+        return
+
+    if previous is not None:
+        user_id, date, time_off_type, amount = previous
+        TimeOffBalance.adjust(user_id, time_off_type, date, accrued=-amount)
+
+    user_id, date, time_off_type, amount = current
+    TimeOffBalance.adjust(user_id, time_off_type, date, accrued=amount)
+
+
+@receiver(post_delete, sender=DayOff, dispatch_uid="day_off_balance_delete")
+def remove_day_off_accrual(sender, instance, *args, **kwargs):
+    TimeOffBalance.adjust(
+        instance.user_id, instance.type, instance.date,
+        accrued=-instance.amount)
+
+
+@receiver(post_save, sender=WorkdayOption, dispatch_uid="workday_option_balance")
+def invalidate_balances_for_option(sender, instance, created, raw, *args, **kwargs):
+    '''
+    changing an option's time off type or adjustment changes every balance that
+    counted it, so let them all be recomputed
+    '''
+    if raw or created:
+        return
+
+    logger.info("Workday option %s changed, invalidating time off balances", instance)
+    TimeOffBalance.invalidate()
+
+
+@receiver(post_save, sender=WorkdayOption, dispatch_uid="workday_option_cache_save")
+@receiver(post_delete, sender=WorkdayOption, dispatch_uid="workday_option_cache_delete")
+def invalidate_workday_options(sender, *args, **kwargs):
+    '''
+    the check-in buttons are cached per process, drop them when an option changes
+    '''
+    WorkdayOption.invalidate_cache()
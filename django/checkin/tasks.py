@@ -1,98 +1,222 @@
 from __future__ import absolute_import, unicode_literals
 import os
 import json
+from collections import defaultdict
 
-from celery import shared_task
-from .models import Profile, Workday, WorkdayOption, DayOff
-from django_celery_beat.models import PeriodicTask, CrontabSchedule
+from celery import shared_task, group
+from .models import Profile, Workday, WorkdayOption, DayOff, TimeOffBalance, RosterEntry, CheckinDispatch, utc_checkin_minute
 from django.conf import settings
+from django.db import transaction
 
 import slacker
-import ftrack_api
 import arrow
 
 from celery.utils.log import get_task_logger
+
+from lucid_api.services.ratelimit import throttle
+from lucid_api.services.registry import registry
+from lucid_api.services.sessions import get_slacker
+
 logger = get_task_logger(__name__)
 
 @shared_task
 def update_user_timezones():
     '''
-    TODO: make this update the crontab stuff
+    This task updates each user's timezone from Slack, and the UTC minute their
+    check-in goes out at (see dispatch_workday_checkins)
 
-    This task updates the celery beat crontab tasks based on the user's current
-    timezone as listed in Slack
+    The whole workspace is read with a few paged users.list calls, and only
+    profiles whose timezone or check-in minute changed are written, with one
+    UPDATE per distinct new value.
     '''
     logger.debug("Starting update_user_timezones")
-    users = Profile.objects.filter(is_active=True)
+    users = Profile.objects.filter(is_active=True).select_related('user')
 
-    # this date will be used to decide the date
-    today = arrow.utcnow()
+    slack = get_slacker(os.environ.get("SLACK_APP_TEAM_TOKEN"))
+    slack_timezones = get_slack_timezones(slack)
 
-    slack = slacker.Slacker(os.environ.get("SLACK_APP_TEAM_TOKEN"))
+    # group the changes by their new values so each one is a single UPDATE
+    changes = defaultdict(list)
 
     for user in users:
-        logger.info("Updating checkin time for %s", user)
-        # for each user, get their timezone and schedule the nag task for 9am
-        user_data = slack.users.info(user.slack_user)
-        tz = user_data.body['user']['tz']
-        # sets checkin for 9am in that timezone
-        user_time = arrow.now(tz).replace(
-            hour=user.start_time.hour,
-            minute=user.start_time.minute,
-            second=user.start_time.second)
-             
-        # shift post time to now
-        server_time = user_time.to(settings.CELERY_TIMEZONE)
-
-        logger.debug("Got user local time as %s, server time %s", user_time, server_time)
-
-        if user.daily_task is None:
-            # create the task and schedule
-            schedule = CrontabSchedule.objects.create(
-                minute=server_time.minute,
-                hour=server_time.hour,
-                day_of_week="*",
-                day_of_month="*",
-                month_of_year="*"
-            )
-            task = PeriodicTask.objects.create(
-                name='Daily-{}'.format(user),
-                task='checkin.tasks.send_workday_checkin',
-                crontab=schedule,
-                args=json.dumps([user.id]),
-            )
-            logger.debug("Creating task %s and assigning to %s", task, user)
-            user.daily_task = task
-            # we save at the end now
-            # user.save()
+        tz = slack_timezones.get(user.slack_user)
+        if tz is None:
+            logger.warn("Couldn't find %s (%s) in slack", user, user.slack_user)
+            continue
+
+        # the minute moves with a new timezone, and with DST
+        checkin_minute = utc_checkin_minute(tz, user.start_time)
+
+        if (user.timezone, user.checkin_minute) != (tz, checkin_minute):
+            changes[(tz, checkin_minute)].append(user.id)
+            logger.info("Updated %s's checkin time to %02d:%02d UTC (%s)",
+                user, checkin_minute // 60, checkin_minute % 60, tz)
+
+    for (tz, checkin_minute), profile_ids in changes.items():
+        Profile.objects.filter(pk__in=profile_ids).update(
+            timezone=tz,
+            checkin_minute=checkin_minute,
+        )
 
-        else:
-            # just update the schedule
-            user.daily_task.crontab.minute = server_time.minute
-            user.daily_task.crontab.hour = server_time.hour
-            # save the schedule
-            user.daily_task.crontab.save()
-            logger.debug("Updating existing task %s for %s", user.daily_task, user)
-        
-        user.timezone = tz
-        user.save()
-        
-        logger.info("Updated %s's checkin time to %s (%s)",
-            user, user_time, server_time)       
+    logger.info("Updated %d checkin schedules",
+        sum(len(ids) for ids in changes.values()))
+
+
+@shared_task
+def dispatch_workday_checkins():
+    '''
+    Runs every minute from beat, and sends the check-in to every active user whose
+    start time falls in the current minute. A run that starts late (or after
+    beat was down) also sends the check-ins of the minutes it missed, up to
+    settings.CHECKIN_CATCH_UP_MINUTES back.
+
+    Check-ins go out in groups of settings.CHECKIN_BATCH_SIZE, each group
+    settings.CHECKIN_BATCH_INTERVAL seconds after the last, to stay under
+    Slack's rate limits.
+    '''
+    now = arrow.utcnow()
+
+    with transaction.atomic():
+        checkin_minutes = CheckinDispatch.claim_minutes(now, settings.CHECKIN_CATCH_UP_MINUTES)
+
+    if len(checkin_minutes) > 1:
+        logger.warn("Catching up on %d minutes of check-ins", len(checkin_minutes))
+
+    profile_ids = list(Profile.objects.filter(
+        is_active=True,
+        checkin_minute__in=checkin_minutes,
+    ).values_list('id', flat=True))
+
+    if not profile_ids:
+        return
+
+    logger.info("Dispatching %d workday checkins for %s", len(profile_ids), now)
+
+    # the roster already has most people's status, ftrack is only asked
+    # (once, for the whole wave) about anybody missing from it
+    users = list(Profile.objects.filter(pk__in=profile_ids).select_related('user'))
+    statuses = get_roster_statuses(users)
+    missing = [user for user in users if user.id not in statuses]
+    if missing:
+        statuses.update(check_user_statuses(missing))
+
+    batch_size = settings.CHECKIN_BATCH_SIZE
+    for batch_number, start in enumerate(range(0, len(profile_ids), batch_size)):
+        batch = profile_ids[start:start + batch_size]
+        group(
+            send_workday_checkin.s(profile_id, status=_status_args(statuses[profile_id]))
+            for profile_id in batch
+        ).apply_async(countdown=batch_number * settings.CHECKIN_BATCH_INTERVAL)
+
+
+def _status_args(status):
+    '''a (WorkdayOption, projects) status as task arguments'''
+    option, projects = status
+    return [option.id if option is not None else None, projects]
+
+
+@shared_task
+def warm_dm_channels():
+    '''
+    Fills in every active user's DM channel with the check-in bot, using a few
+    paged conversations.list calls, so check-ins never have to look one up
+    '''
+    slack = get_slacker(os.environ.get("LUCILLE_BOT_TOKEN"))
+
+    dm_channels = {}
+    cursor = None
+    while True:
+        throttle('slack_service', 'conversations.list')
+        # the pinned slacker has no conversations api, so call the method directly
+        response = slack.im.get('conversations.list', params={
+            'types': 'im',
+            'limit': 1000,
+            'cursor': cursor,
+        }).body
+
+        for im in response['channels']:
+            dm_channels[im['user']] = im['id']
+
+        cursor = response.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            break
+
+    updated = 0
+    for user in Profile.objects.filter(is_active=True):
+        channel = dm_channels.get(user.slack_user)
+        if channel and channel != user.slack_dm_channel:
+            Profile.objects.filter(pk=user.id).update(slack_dm_channel=channel)
+            updated += 1
+
+    logger.info("Updated %d DM channels", updated)
+
+
+def get_dm_channel(slack, user):
+    '''
+    returns the id of the bot's DM channel with *user*, opening (and remembering)
+    it if we don't know it yet
+
+    ###Args:
+    - `slack`: a slacker.Slacker using the check-in bot's token
+    - `user`: a checkin.Profile model object
+    '''
+    if not user.slack_dm_channel:
+        throttle('slack_service', 'conversations.open')
+        channel = slack.im.post('conversations.open', data={
+            'users': user.slack_user,
+        }).body['channel']['id']
+        user.slack_dm_channel = channel
+        Profile.objects.filter(pk=user.id).update(slack_dm_channel=channel)
+
+    return user.slack_dm_channel
+
+
+def get_slack_timezones(slack):
+    '''
+    pages through the slack workspace's members
+
+    ###Returns:
+    A dict of slack member id to timezone name
+    '''
+    timezones = {}
+    cursor = None
+
+    while True:
+        throttle('slack_service', 'users.list')
+        # slacker's users.list doesn't take paging arguments, so call the method directly
+        response = slack.users.get('users.list', params={'limit': 200, 'cursor': cursor}).body
+
+        for member in response['members']:
+            if member.get('tz'):
+                timezones[member['id']] = member['tz']
+
+        cursor = response.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            return timezones
 
 @shared_task(bind=True)
-def send_workday_checkin(self, user_profile_id):
+def send_workday_checkin(self, user_profile_id, status=None):
     '''
     Sends an individual message to ask a user to check in for today (based on Pacific TZ)
+
+    ###Args:
+    - `user_profile_id`: the checkin.Profile to send to
+    - `status` __optional__: [WorkdayOption id or None, projects] already worked out
+    by dispatch_workday_checkins. Read from the roster (or ftrack) if it isn't given.
     '''
 
     logger.info("Sending workday checkin for user_profile_id: %s", user_profile_id)
 
-    slacker_instance = slacker.Slacker(os.environ.get("LUCILLE_BOT_TOKEN"))
-    user = Profile.objects.get(pk=user_profile_id)
+    slacker_instance = get_slacker(os.environ.get("LUCILLE_BOT_TOKEN"))
+    # the balances are read for every time off button
+    user = Profile.objects.select_related('user').prefetch_related('balances').get(pk=user_profile_id)
 
     # see if the user can be accounted for today
-    option, projects = check_user_status(user)
+    if status is None:
+        option, projects = get_roster_statuses([user]).get(user.id) or check_user_status(user)
+    else:
+        option_id, projects = status
+        option = WorkdayOption.objects.get(pk=option_id) if option_id else None
 
     # create the checkin, or use the existing one
     today, created = Workday.objects.get_or_create(
@@ -110,13 +234,9 @@ def send_workday_checkin(self, user_profile_id):
     # If the message has been posted before, wipe it clean
     if len(today.slack_message_ts) > 0:
         try:
-            ims = slacker_instance.im.list().body['ims']
-            for im in ims:
-                if im['user'] == user.slack_user:
-                    channel = im['id']
-                    break
-            
+            channel = get_dm_channel(slacker_instance, user)
             logger.debug("Channel should be %s", channel)
+            throttle('slack_service', 'chat.update')
             obj = slacker_instance.chat.update(
                 channel=channel,
                 text="_Check-in for {} was re-issued!_".format(today_str),
@@ -127,12 +247,11 @@ def send_workday_checkin(self, user_profile_id):
             logger.warn("Couldn't wipe old message %s", today.slack_message_ts, exc_info=True)
             pass
 
-    # Get the available options, based on the workday
-    option_set = WorkdayOption.objects.filter(is_active=True).order_by('sort_order')
-    # format the options into an actions list for the message attachment
-    actions = [option.as_json(user=user) for option in option_set]
+    # format the available options into an actions list for the message attachment
+    actions = WorkdayOption.actions_for(user)
     
     try:
+        throttle('slack_service', 'chat.postMessage')
         obj = slacker_instance.chat.post_message(
             channel="@{}".format(user.slack_user),
             text="",
@@ -157,6 +276,11 @@ def send_workday_checkin(self, user_profile_id):
             today.is_posted = True
             today.slack_message_ts = obj.body['ts']
             today.save()
+
+            # remember the DM channel for re-issues and close outs
+            if obj.body['channel'] != user.slack_dm_channel:
+                user.slack_dm_channel = obj.body['channel']
+                Profile.objects.filter(pk=user.id).update(slack_dm_channel=user.slack_dm_channel)
         else:
             logger.error("Slack message failed: %s", obj.body)
 
@@ -210,9 +334,10 @@ def handle_workday(self, data):
         logger.error("Couldn't set response!", exc_info=True)
         self.retry(exc=e)
 
-    slack = slacker.Slacker(os.environ.get('LUCILLE_BOT_TOKEN'))
+    slack = get_slacker(os.environ.get('LUCILLE_BOT_TOKEN'))
 
     try:
+        throttle('slack_service', 'chat.update')
         update_response = slack.chat.update(
             ts=original_ts,
             text="",
@@ -281,12 +406,13 @@ def close_out_workday(self, workday_id):
         today.response = option
         today.save()
 
-        slack = slacker.Slacker(os.environ.get('LUCILLE_BOT_TOKEN'))
+        slack = get_slacker(os.environ.get('LUCILLE_BOT_TOKEN'))
 
+        throttle('slack_service', 'chat.update')
         response = slack.chat.update(
             ts=today.slack_message_ts,
             text="",
-            channel=user.slack_user,
+            channel=get_dm_channel(slack, user),
             attachments=[{
                 "text" : "{icon}Since you didn't respond within 12 hours I've marked you as *{status}* on *{date}*".format(
                     status=option, 
@@ -306,20 +432,8 @@ def close_out_workday(self, workday_id):
         # let's see if they've worked over the last 7 days
         # and if so, issue them a bonus flex day
 
-        recent = Workday.objects.filter(
-                user=today.user
-            ).filter(
-                date__gte=arrow.now().shift(years=-1).date()
-            ).order_by('-date').select_related('response')
-
-        # look through the days and break when we get a non-working one
-        working_count = 0
-        for day in recent:
-            if day.response.time_off_type is None:
-                # working day
-                working_count+=1
-            else:
-                break
+        # the streak is kept up to date as responses come in (see checkin.signals)
+        working_count = user.working_streak
         
         # now modulo divide by 7. every 7th day working they get a bonus.
         if working_count % 7 == 0 and working_count > 6:
@@ -331,6 +445,10 @@ def issue_flex_day(self, note=None, user_id=None):
     '''
     issues a flex day for the current day
 
+    The days off are written together in one transaction, users who already
+    have this flex day are skipped. The slack messages are sent afterwards by
+    notify_day_off tasks, in groups like the check-ins.
+
     ###Args:
     - **note**:optional string to add to the note field
     - **user_id**: optional, if supplied, only issue flex day to this user
@@ -342,28 +460,69 @@ def issue_flex_day(self, note=None, user_id=None):
         users = Profile.objects.filter(is_active=True)
 
     today=arrow.utcnow().date()
+    fields = dict(
+        date=today,
+        type='flex',
+        amount=1,
+        note="Automatically issued from 'issue_flex_day'. {}".format(note),
+    )
 
-    slack = slacker.Slacker(os.environ.get("LUCILLE_BOT_TOKEN"))
+    with transaction.atomic():
+        user_ids = set(users.values_list('id', flat=True))
+        # running this twice shouldn't issue the day twice
+        user_ids -= set(DayOff.objects.filter(user_id__in=user_ids, **fields).values_list('user_id', flat=True))
+        if not user_ids:
+            logger.info("Flex day was already issued on %s", today)
+            return
 
-    for user in users:
-        # issue flex day
-        flex_day, created = DayOff.objects.get_or_create(
-            user=user,
-            date=today,
-            type='flex',
-            amount=1,
-            note="Automatically issued from 'issue_flex_day'. {}".format(note),
-        )
+        day_offs = DayOff.objects.bulk_create(
+            [DayOff(user_id=profile_id, **fields) for profile_id in sorted(user_ids)])
+
+        # bulk_create doesn't send post_save, so apply what checkin.signals
+        # would have to the balances here
+        TimeOffBalance.adjust(list(user_ids), 'flex', today, accrued=fields['amount'])
+
+        day_off_ids = [day_off.id for day_off in day_offs]
+        if None in day_off_ids:
+            # only postgres gives us the new ids back
+            day_off_ids = list(DayOff.objects.filter(
+                user_id__in=user_ids, **fields).values_list('id', flat=True))
+
+        transaction.on_commit(lambda: _notify_day_offs(day_off_ids, note))
 
-        logger.info("Flex day added for %s on %s",user,today )
+    logger.info("Flex day added for %d users on %s", len(day_off_ids), today)
+
+
+def _notify_day_offs(day_off_ids, note):
+    batch_size = settings.CHECKIN_BATCH_SIZE
+    for batch_number, start in enumerate(range(0, len(day_off_ids), batch_size)):
+        batch = day_off_ids[start:start + batch_size]
+        group(notify_day_off.s(day_off_id, note) for day_off_id in batch).apply_async(
+            countdown=batch_number * settings.CHECKIN_BATCH_INTERVAL)
+
+
+@shared_task(bind=True)
+def notify_day_off(self, day_off_id, note=None):
+    '''
+    lets the user know they've been given a day off
+    '''
+    day_off = DayOff.objects.select_related('user__user').get(pk=day_off_id)
+
+    slack = get_slacker(os.environ.get("LUCILLE_BOT_TOKEN"))
+
+    try:
+        throttle('slack_service', 'chat.postMessage')
         slack.chat.post_message(
-            user.slack_user,
+            day_off.user.slack_user,
             ":bowtie: added a *{}*. {}".format(
-                flex_day,
+                day_off,
                 note
             ),
             as_user=True,
         )
+    except slacker.Error as e:
+        logger.error("Slack API Error:", exc_info=True)
+        raise self.retry(exc=e, countdown=5)
 
 
 def check_user_status(user, when=None):
@@ -379,87 +538,260 @@ def check_user_status(user, when=None):
     - `status`: a checkin.WorkdayOption for the user for today. `None` if the user cannot be accounted for.
     - `projects`: array of the the primary key of a the project which a user is working on, if applicable
     '''
-    logger = get_task_logger(__name__)
-    if logger is None:
-        import logging
-        logger = logging.getLogger(__name__)
-
     logger.info("Checking user status for %s", user)
 
-    # figure some time stuff real quick like
+    return check_user_statuses([user], when=when)[user.id]
+
+
+def check_user_statuses(users, when=None):
+    '''
+    checks the status of a group of users (ie: a dispatch wave) with the various apis.
+    ftrack is asked about everybody at once, using the worker's ftrack service
+
+    ###Args:
+    - `users`: checkin.Profile model objects, ideally with `select_related('user')`
+    - `when` __optional__: an Arrow time to check status for
+
+    ##Returns:
+    A dict of Profile id to (`status`, `projects`), as from check_user_status
+    '''
+    users = list(users)
+    statuses = dict((user.id, (None, [])) for user in users)
+    if not users:
+        return statuses
+
+    days = [(user.id, user, _checkin_day(user, when)) for user in users]
+
+    # ftrack, for days on-site
+    try:
+        on_site = _get_on_site_projects(days)
+    except:
+        # just protecting to make sure all services run
+        logger.error("Couldn't check ftrack for on-site tasks", exc_info=True)
+        on_site = {}
+
+    if on_site:
+        option = _get_working_option()
+        for user_id, projects in on_site.items():
+            statuses[user_id] = (option, projects)
+
+    # TODO: check xero for vacation!
+
+    return statuses
+
+
+@shared_task
+def build_daily_roster():
+    '''
+    Works out today's and tomorrow's status for every active user (in their own
+    timezone) ahead of their check-ins, from ftrack's On Site tasks.
+
+    Runs from beat through the day so the roster follows changes in ftrack. Only
+    new or changed entries are written. If ftrack can't be reached the roster is
+    left as it was.
+    '''
+    users = list(Profile.objects.filter(is_active=True).exclude(timezone="").select_related('user'))
+    if not users:
+        return
+
+    days = []
+    for user in users:
+        today = arrow.now(tz=user.timezone).date()
+        for date in (today, arrow.get(today).shift(days=+1).date()):
+            days.append(((user.id, date), user, _roster_day(user, date)))
+
+    on_site = _get_on_site_projects(days)
+    working = _get_working_option() if on_site else None
+
+    created = []
+    changed = 0
+    with transaction.atomic():
+        existing = dict(
+            ((entry.user_id, entry.date), entry)
+            for entry in RosterEntry.objects.select_for_update().filter(
+                user__in=users,
+                date__in=set(key[1] for key, user, day in days),
+            )
+        )
+
+        for key, user, day in days:
+            projects = on_site.get(key)
+            option_id = working.id if projects is not None else None
+            projects = projects or []
+
+            entry = existing.get(key)
+            if entry is None:
+                entry = RosterEntry(user=user, date=key[1], option_id=option_id)
+                entry.project_ids = projects
+                created.append(entry)
+
+            elif entry.option_id != option_id or entry.project_ids != projects:
+                entry.option_id = option_id
+                entry.project_ids = projects
+                entry.save()
+                changed += 1
+
+        RosterEntry.objects.bulk_create(created)
+
+    logger.info("Roster has %d new and %d changed entries (%d users on site)",
+        len(created), changed, len(on_site))
+
+
+def get_roster_statuses(users):
+    '''
+    reads the users' status for today (in their own timezone) from the roster,
+    with one query
+
+    ###Args:
+    - `users`: checkin.Profile model objects
+
+    ##Returns:
+    A dict of Profile id to (`status`, `projects`), as from check_user_status.
+    Users without a roster entry for today are left out.
+    '''
+    dates = {}
+    for user in users:
+        if user.timezone:
+            dates[user.id] = arrow.now(tz=user.timezone).date()
+
+    if not dates:
+        return {}
+
+    entries = RosterEntry.objects.filter(
+        user_id__in=dates.keys(),
+        date__in=set(dates.values()),
+    ).select_related('option')
+
+    statuses = {}
+    for entry in entries:
+        if dates[entry.user_id] == entry.date:
+            statuses[entry.user_id] = (entry.option, entry.project_ids)
+
+    return statuses
+
+
+def _get_working_option():
+    try:
+        return WorkdayOption.objects.filter(time_off_type=None,name="Working")[0]
+    except IndexError:
+        # something has happened to the default working option!
+        logger.error("Couldn't find the default working option. Is it not called Working anymore?")
+        raise AttributeError("Couldn't find default working option")
+
+
+def _roster_day(user, date):
+    '''
+    the start of the user's check-in day on *date*, in their timezone
+    '''
+    return arrow.get(date).replace(
+        tzinfo=user.timezone,
+        hour=user.start_time.hour,
+        minute=user.start_time.minute,
+        )
+
+
+def _checkin_day(user, when=None):
+    '''
+    the start of the check-in day *when* (or now) falls in, in the user's timezone
+    '''
     # use the time we're supplied, if given
-    if isinstance(when, arrow.Arrow): 
-        now = when
+    if isinstance(when, arrow.Arrow):
+        now = when.to(user.timezone)
     else:
         now = arrow.now(tz=user.timezone)
-    
+
     today = now.replace(hour=user.start_time.hour, minute=user.start_time.minute)
     # this is being called before the day's checkin, so count it on the day before
     if now.time() < user.start_time:
         today = today.shift(days=-1)
 
-    # ftrack, for days on-site
-    try: 
-        ftrack = ftrack_api.Session()
-        
-        # get user
-        try:
-            ft_user = ftrack.query("User where email is '{}'".format(user.user.email)).one()
-        except:
-            logger.error("Couldn't retrieve ftrack user for %s", user, exc_info=True)
-            raise IOError("Couldn't get user")
-        
-        # check for tasks
-        try:
-            query = "Task where "\
-            "type.name like '%On Site%' and "\
-            "assignments any (resource.id = '{id}') and "\
-            "start_date <= '{next_check}' and "\
-            "end_date >= '{last_check}'".format(
-                id=ft_user['id'],
-                next_check=today.shift(days=+1),
-                last_check=today
-                )
+    return today
 
-            logger.debug(query)
 
-            tasks = ftrack.query(query)
+def _get_on_site_projects(days):
+    '''
+    finds everybody's On Site tasks with two ftrack queries: one for the users,
+    one for the tasks of all of them over the span of their check-in days
 
-        except:
-            logger.error("Had an error querying ftrack for tasks. %s", query, exc_info=True)
-            raise IOError("Query failed")
-
-        if len(tasks) > 0:
-            # user has on-site tasks today!
-            try:
-                option = WorkdayOption.objects.filter(time_off_type=None,name="Working")[0]
-            except:
-                # something has happened to the default working option!
-                logger.error("Couldn't find the default working option. Is it not called Working anymore?")
-                raise AttributeError("Couldn't find default working option")
-            
-            # let's figure out which project(s) it is
-            projects = []
-            try:
-                for task in tasks:
-                    projects.append(int(task['project']['custom_attributes']['project_id']))
-            except: 
-                # ok to fail for now
-                pass 
-
-            return (option, projects)
-        
-        else:
-            logger.error("No tasks found in ftrack for %s on %s", user, today, exc_info=True)
-                
-    except:
-        # should I do something here? just protecting to make sure all services run
-        pass
+    ###Args:
+    - `days`: a list of (`key`, `user`, `day`) where `user` is a checkin.Profile
+    and `day` the start of a check-in day to look at for them
 
-    # TODO: check xero for vacation!
+    ##Returns:
+    A dict of `key` to the lucid project ids they're on site for, only for the
+    days with an On Site task
+    '''
+    # building a session loads the whole schema, so use the registry's ftrack
+    # service, which is rebuilt after SERVICE_CLIENT_TTL or when it breaks
+    try:
+        return _query_on_site_projects(registry.get('ftrack_service').session, days)
+    except Exception:
+        # a broken session would fail every check-in after this one
+        registry.invalidate('ftrack_service')
+        raise
+
+
+def _query_on_site_projects(ftrack, days):
+    # ftrack is asked for the emails as they are, the answers are matched
+    # back without minding case
+    emails = set()
+    by_email = defaultdict(list)
+    for key, user, day in days:
+        if user.user.email:
+            emails.add(user.user.email)
+            by_email[user.user.email.lower()].append((key, day))
+
+    if not emails:
+        return {}
+
+    ft_users = ftrack.query("select id, email from User where email in ({})".format(
+        ", ".join(_quote(email) for email in sorted(emails))
+        )).all()
+
+    by_resource = {}
+    for ft_user in ft_users:
+        by_resource[ft_user['id']] = by_email.get((ft_user['email'] or '').lower(), [])
+
+    if not by_resource:
+        logger.warn("None of %d users were found in ftrack", len(by_email))
+        return {}
+
+    query = "select start_date, end_date, project.name, assignments.resource_id from Task where "\
+        "type.name like '%On Site%' and "\
+        "assignments any (resource_id in ({ids})) and "\
+        "start_date <= '{next_check}' and "\
+        "end_date >= '{last_check}'".format(
+            ids=", ".join('"{}"'.format(resource_id) for resource_id in by_resource),
+            next_check=max(day for key, user, day in days).shift(days=+1),
+            last_check=min(day for key, user, day in days),
+            )
+
+    logger.debug(query)
+
+    on_site = {}
+    for task in ftrack.query(query).all():
+        for assignment in task['assignments']:
+            for key, today in by_resource.get(assignment['resource_id'], []):
+                # the query covers everybody's day, check this one is on theirs
+                if task['start_date'] > today.shift(days=+1) or task['end_date'] < today:
+                    continue
+
+                projects = on_site.setdefault(key, [])
+                try:
+                    # ftrack projects are named after the lucid project id (see ftrack_service)
+                    project_id = int(task['project']['name'])
+                except (TypeError, ValueError):
+                    # ok to fail for now
+                    continue
+
+                if project_id not in projects:
+                    projects.append(project_id)
+
+    return on_site
 
-    # user cannot be accounted for
-    return (None, [])
+def _quote(value):
+    '''a double quoted string for an ftrack query'''
+    return '"{}"'.format(value.replace('\\', '\\\\').replace('"', '\\"'))
 
 def test_check_status():
     '''
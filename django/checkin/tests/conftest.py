@@ -0,0 +1,54 @@
+'''
+shared check-in test data
+'''
+
+import arrow
+import pytest
+
+from django.contrib.auth.models import User
+
+from checkin.models import Profile, WorkdayOption
+
+
+@pytest.fixture
+def options(db):
+    '''
+    the usual check-in options, by name
+    '''
+    options = {}
+    for sort_order, (name, time_off_type) in enumerate([
+            ("Working", None),
+            ("Vacation", 'vacation'),
+            ("Sick", 'sick'),
+            ("Flex", 'flex')]):
+        options[name] = WorkdayOption.objects.create(
+            name=name,
+            time_off_type=time_off_type,
+            time_off_adjustment=1 if time_off_type else 0,
+            sort_order=sort_order,
+        )
+    return options
+
+
+@pytest.fixture
+def make_profile(db):
+    '''
+    returns a function that makes a check-in user
+    '''
+    def make_profile(username, **fields):
+        user = User.objects.create(username=username, email="{}@example.com".format(username))
+        fields.setdefault('slack_user', "U{}".format(username.upper()))
+        fields.setdefault('timezone', 'America/Los_Angeles')
+        return Profile.objects.create(user=user, **fields)
+
+    return make_profile
+
+
+@pytest.fixture
+def profile(make_profile):
+    return make_profile('kyle')
+
+
+@pytest.fixture
+def today():
+    return arrow.now().date()
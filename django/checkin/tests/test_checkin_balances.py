@@ -0,0 +1,97 @@
+'''
+tests for keeping the TimeOffBalance ledger up to date (see checkin.signals)
+'''
+
+import arrow
+import pytest
+
+from checkin.models import DayOff, TimeOffBalance, Workday
+
+TYPES = ('vacation', 'sick')
+
+
+def ledger(profile, time_off_type):
+    balance = TimeOffBalance.objects.get(user=profile, time_off_type=time_off_type)
+    return balance.as_of, balance.accrued, balance.used
+
+
+def assert_ledger_matches(profile, today):
+    '''
+    the balances the signals kept are current, and what a full recompute gives
+    '''
+    for time_off_type in TYPES:
+        as_of, accrued, used = ledger(profile, time_off_type)
+        assert as_of == today
+
+        balance = profile.refresh_balance(
+            time_off_type,
+            balance=TimeOffBalance.objects.get(user=profile, time_off_type=time_off_type))
+        assert (accrued, used) == (balance.accrued, balance.used)
+
+
+@pytest.fixture
+def primed(profile, options, today):
+    '''
+    a user whose balances are current, so changes are applied to them in place
+    '''
+    for time_off_type in TYPES:
+        profile.days(time_off_type)
+    return profile
+
+
+def test_workday_responses(primed, options, today):
+    workday = Workday.objects.create(user=primed, date=today, response=options['Vacation'])
+    assert ledger(primed, 'vacation')[2] == 1
+    assert_ledger_matches(primed, today)
+
+    # changing the response moves the day from one type to the other
+    workday.response = options['Sick']
+    workday.save()
+    assert ledger(primed, 'vacation')[2] == 0
+    assert ledger(primed, 'sick')[2] == 1
+    assert_ledger_matches(primed, today)
+
+    workday.delete()
+    assert ledger(primed, 'sick')[2] == 0
+    assert_ledger_matches(primed, today)
+
+
+def test_days_off(primed, today):
+    day_off = DayOff.objects.create(user=primed, date=today, type='vacation', amount=5)
+    assert ledger(primed, 'vacation')[1] == 5
+    assert_ledger_matches(primed, today)
+
+    day_off.amount = 3
+    day_off.save()
+    assert ledger(primed, 'vacation')[1] == 3
+    assert_ledger_matches(primed, today)
+
+    day_off.type = 'sick'
+    day_off.save()
+    assert ledger(primed, 'vacation')[1] == 0
+    assert ledger(primed, 'sick')[1] == 3
+    assert_ledger_matches(primed, today)
+
+    day_off.delete()
+    assert ledger(primed, 'sick')[1] == 0
+    assert_ledger_matches(primed, today)
+
+
+def test_stale_balance_is_recomputed(primed, today):
+    DayOff.objects.create(user=primed, date=today, type='vacation', amount=2)
+    # yesterday's numbers, whatever they were, aren't trusted today
+    TimeOffBalance.objects.filter(user=primed).update(
+        as_of=arrow.get(today).shift(days=-1).date(), accrued=99, used=99)
+
+    assert primed.days('vacation') == (2, 0)
+    assert ledger(primed, 'vacation') == (today, 2, 0)
+
+
+def test_option_change_invalidates_balances(primed, options, today):
+    Workday.objects.create(user=primed, date=today, response=options['Vacation'])
+
+    options['Vacation'].time_off_adjustment = 0.5
+    options['Vacation'].save()
+    assert ledger(primed, 'vacation')[0] is None
+
+    assert primed.days('vacation') == (0, 0.5)
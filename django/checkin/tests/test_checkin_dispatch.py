@@ -0,0 +1,41 @@
+'''
+tests for the per-minute check-in dispatch catching up on missed minutes
+'''
+
+import arrow
+import pytest
+
+from checkin.models import CheckinDispatch
+
+
+START = arrow.get('2018-03-13T17:00:30+00:00')
+
+
+@pytest.fixture(autouse=True)
+def dispatched(db):
+    '''
+    the dispatch has sent everything up to the minute before START
+    '''
+    CheckinDispatch.objects.update_or_create(
+        pk=1, defaults={'last_minute': START.floor('minute').shift(minutes=-1).datetime})
+
+
+def test_each_minute_is_claimed_once():
+    assert CheckinDispatch.claim_minutes(START, 180) == [17 * 60]
+    # a second dispatcher in the same minute has nothing left to send
+    assert CheckinDispatch.claim_minutes(START.shift(seconds=+20), 180) == []
+
+
+def test_late_run_catches_up():
+    CheckinDispatch.claim_minutes(START, 180)
+
+    assert CheckinDispatch.claim_minutes(START.shift(minutes=+3), 180) == [
+        17 * 60 + 1, 17 * 60 + 2, 17 * 60 + 3]
+
+
+def test_catch_up_is_limited():
+    CheckinDispatch.claim_minutes(START, 180)
+
+    # beat was down for a day, only the last 10 minutes are sent
+    minutes = CheckinDispatch.claim_minutes(START.shift(days=+1), 10)
+    assert minutes == [17 * 60 - 10 + i for i in range(11)]
@@ -0,0 +1,29 @@
+'''
+tests for issuing flex days in bulk (issue_flex_day)
+'''
+
+import pytest
+
+from checkin import tasks
+from checkin.models import DayOff, TimeOffBalance
+
+
+def test_flex_day_is_issued_once(make_profile, options):
+    users = [make_profile('kyle'), make_profile('jo')]
+    retired = make_profile('sam', is_active=False)
+    for user in users + [retired]:
+        # current balances, so the new days are added to them in place
+        user.days('flex')
+
+    tasks.issue_flex_day(note="Company day")
+    tasks.issue_flex_day(note="Company day")
+
+    for user in users:
+        assert DayOff.objects.filter(user=user, type='flex').count() == 1
+
+        balance = TimeOffBalance.objects.get(user=user, time_off_type='flex')
+        assert balance.accrued == 1
+        assert user.refresh_balance('flex', balance=balance).accrued == 1
+
+    assert not DayOff.objects.filter(user=retired).exists()
+    assert TimeOffBalance.objects.get(user=retired, time_off_type='flex').accrued == 0
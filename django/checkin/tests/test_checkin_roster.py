@@ -0,0 +1,83 @@
+'''
+tests for keeping the on-site roster in step with ftrack (build_daily_roster)
+'''
+
+import arrow
+import pytest
+
+from checkin import tasks
+from checkin.models import RosterEntry
+
+
+@pytest.fixture
+def on_site(monkeypatch):
+    '''
+    what ftrack says: (profile id, date) to the lucid project ids they're on site for
+    '''
+    on_site = {}
+    monkeypatch.setattr(tasks, '_get_on_site_projects', lambda days: dict(on_site))
+    return on_site
+
+
+@pytest.fixture
+def users(make_profile, options):
+    return make_profile('kyle'), make_profile('jo', timezone='Europe/London')
+
+
+def local_days(user):
+    today = arrow.now(tz=user.timezone).date()
+    return today, arrow.get(today).shift(days=+1).date()
+
+
+def roster():
+    return dict(
+        ((entry.user_id, entry.date), (entry.option_id, entry.project_ids, entry.updated))
+        for entry in RosterEntry.objects.all()
+    )
+
+
+def test_roster_follows_ftrack(users, options, on_site):
+    kyle, jo = users
+    kyle_today = local_days(kyle)[0]
+    jo_tomorrow = local_days(jo)[1]
+
+    on_site[(kyle.id, kyle_today)] = [12]
+    tasks.build_daily_roster()
+
+    first = roster()
+    # today and tomorrow for both
+    assert len(first) == 4
+    assert first[(kyle.id, kyle_today)][:2] == (options["Working"].id, [12])
+    assert first[(jo.id, jo_tomorrow)][:2] == (None, [])
+
+    # nothing changed in ftrack, nothing is written
+    tasks.build_daily_roster()
+    assert roster() == first
+
+    # kyle's task went away, jo got one
+    del on_site[(kyle.id, kyle_today)]
+    on_site[(jo.id, jo_tomorrow)] = [40, 41]
+    tasks.build_daily_roster()
+
+    second = roster()
+    assert len(second) == 4
+    assert second[(kyle.id, kyle_today)][:2] == (None, [])
+    assert second[(jo.id, jo_tomorrow)][:2] == (options["Working"].id, [40, 41])
+    # the others were left alone
+    for key in set(first) - set([(kyle.id, kyle_today), (jo.id, jo_tomorrow)]):
+        assert second[key] == first[key]
+
+
+def test_roster_is_kept_when_ftrack_fails(users, monkeypatch, on_site):
+    kyle, jo = users
+    on_site[(kyle.id, local_days(kyle)[0])] = [12]
+    tasks.build_daily_roster()
+    before = roster()
+
+    def down(days):
+        raise IOError("ftrack is down")
+    monkeypatch.setattr(tasks, '_get_on_site_projects', down)
+
+    with pytest.raises(IOError):
+        tasks.build_daily_roster()
+    assert roster() == before
@@ -0,0 +1,65 @@
+'''
+tests for counting working streaks as responses come in (Profile.record_workday)
+'''
+
+import arrow
+import pytest
+
+from checkin.models import Profile, Workday
+
+
+@pytest.fixture
+def respond(profile, options, today):
+    '''
+    returns a function that answers the check-in *days_ago* with *option*, and
+    returns the user's streak afterwards
+    '''
+    def respond(days_ago, option):
+        date = arrow.get(today).shift(days=-days_ago).date()
+        # a fresh user each time, like separate check-in requests
+        user = Profile.objects.get(pk=profile.pk)
+        workday, _ = Workday.objects.get_or_create(user=user, date=date)
+        workday.response = options[option]
+        workday.save()
+        return Profile.objects.get(pk=profile.pk).working_streak
+
+    return respond
+
+
+def rebuilt_streak(profile):
+    profile = Profile.objects.get(pk=profile.pk)
+    profile.rebuild_streak()
+    return profile.working_streak
+
+
+def test_gap_day_doesnt_break_the_streak(profile, respond):
+    assert respond(4, "Working") == 1
+    assert respond(3, "Working") == 2
+    # nobody checked in two days ago (a weekend...)
+    assert respond(1, "Working") == 3
+    assert respond(0, "Vacation") == 0
+    assert rebuilt_streak(profile) == 0
+
+
+def test_edited_response(profile, respond):
+    respond(2, "Working")
+    respond(1, "Working")
+    assert respond(0, "Working") == 3
+
+    # today's answer changes its mind, then changes back
+    assert respond(0, "Sick") == 0
+    assert respond(0, "Working") == 3
+
+    # an older day changing falls back to a rebuild
+    assert respond(1, "Vacation") == 1
+    assert rebuilt_streak(profile) == 1
+
+
+def test_rebuild_matches_incremental(profile, respond):
+    for days_ago, option in [
+            (9, "Working"), (8, "Sick"), (7, "Working"), (6, "Working"),
+            (4, "Working"), (3, "Flex"), (2, "Working"), (1, "Working"), (0, "Working")]:
+        streak = respond(days_ago, option)
+
+    assert streak == 3
+    assert rebuilt_streak(profile) == streak
@@ -4,7 +4,7 @@ from __future__ import unicode_literals
 from django.contrib import admin
 
 
-from .models import Project, ProjectType, ServiceConnection, TemplateProject, TemplateServiceConnection
+from .models import Project, ProjectType, ServiceConnection, TemplateProject, TemplateServiceConnection, ProviderHealth
 # Register your models here.
 
 
@@ -90,6 +90,19 @@ class ProjectAdmin(admin.ModelAdmin):
         ),
     ]
     inlines = [ServiceConnectionInlineExisting, ServiceConnectionInlineAdd]
+    actions = ['archive_projects', 'unarchive_projects']
+
+    def archive_projects(self, request, queryset):
+        count = queryset.archive()
+        self.message_user(request, "Archived {} project(s)".format(count))
+
+    archive_projects.short_description = "Archive selected projects"
+
+    def unarchive_projects(self, request, queryset):
+        count = queryset.unarchive()
+        self.message_user(request, "Unarchived {} project(s)".format(count))
+
+    unarchive_projects.short_description = "Unarchive selected projects"
 
     def queryset(self, request):
         qs = super(EntryAdmin, self).queryset(request)
@@ -139,3 +152,16 @@ class TemplateProjectAdmin(admin.ModelAdmin):
 
 
 admin.site.register(TemplateProject, TemplateProjectAdmin)
+
+
+class ProviderHealthAdmin(admin.ModelAdmin):
+    ''' shows which services are failing, clear paused_until to resume one early '''
+    icon = '<i class="material-icons">healing</i>'
+    list_display = ('service_name', 'failures', 'paused_until', 'last_error')
+    readonly_fields = ('service_name', 'failures', 'last_error')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(ProviderHealth, ProviderHealthAdmin)
@@ -6,72 +6,71 @@ from __future__ import unicode_literals
 import os
 import logging
 
-from ..services.slack_service import Service as SlackService
-
+logger = logging.getLogger(__name__)
 
+# both replies are sent back as the http response, so the web process never
+# has to build a slack client or wait on another call to slack
 
-logger = logging.getLogger(__name__)
 
-def send_confirmation(slack_message, command):
+def confirmation_message(slack_message, command):
     ''' 
-    send a confirmation for the command which was issued
+    builds the confirmation for the command which was issued, to be returned
+    as the slash command's http response
     
     ### Params:
     - **slack_message**: a dict-like object containing the full slash command post payload
 
     ### Returns:
-    **Nothing**
+    **dict** of the ephemeral slack message
     '''
-    # setup slack
-    slack = SlackService()
-
-    url = slack_message['response_url']
     title = slack_message.get('text', 'this project')
     if not title or len(title) == 0:
         title="this project"
 
-    slack.respond_to_url(url, ephemeral=True, attachments=[{
-        "title": "Confirm that you would like to {} {}?".format(command, title),
-        "actions": [
-            {
-                "name": title,
-                "text": "Confirm",
-                "value": "True",
-                "type": "button",
-                "style": "primary"
-            },
-            {
-                "name": title,
-                "text": "Cancel",
-                "value": "False",
-                "type": "button",
-                "style": "danger"
-            }
-        ],
-        "callback_id": command,
-        "attachment_type": "default"
-    }])
-
-    return
+    return {
+        "response_type": "ephemeral",
+        "attachments": [{
+            "title": "Confirm that you would like to {} {}?".format(command, title),
+            "actions": [
+                {
+                    "name": title,
+                    "text": "Confirm",
+                    "value": "True",
+                    "type": "button",
+                    "style": "primary"
+                },
+                {
+                    "name": title,
+                    "text": "Cancel",
+                    "value": "False",
+                    "type": "button",
+                    "style": "danger"
+                }
+            ],
+            "callback_id": command,
+            "attachment_type": "default"
+        }],
+    }
 
 def check_confirmation(slack_message):
     '''
-    Checks the confirmation message and returns the command and arguments if approved
+    Checks the confirmation message and returns the reply, and the command and
+    arguments if approved
 
     ### Params:
     - **slack_message**: a dict-like object containing the full slash command post payload
 
     ### Returns:
-    **(channel_id, command, args)** where **channel_id** is the channel id where the command was issued,
+    **(reply, confirmed)** where **reply** is the message (dict) to return as the
+    http response, replacing the confirmation, and **confirmed** is
+    **(channel_id, command, args)** or **None** if the user canceled.
+    **channel_id** is the channel id where the command was issued,
     **command** is the original slash command and **args** is the original argument
     '''
 
     if 'actions' not in slack_message.keys():
         raise AttributeError("Message does not contain an action!")
     
-    # setup slack
-    slack = SlackService()
-    
     # handling actions from interactive message
     action = slack_message['actions'][0]
     logger.info("Dealing with actions %s", action)
@@ -83,18 +82,15 @@ def check_confirmation(slack_message):
         channel = slack_message['channel']['id']
         logger.info("User has confirmed %s %s on channel %s", command, arg, channel)
 
-        callback_url = slack_message['response_url']
-        slack.respond_to_url(callback_url,
-            "Working on running *{} {}* right now for you".format(command, arg),
-            ephemeral=True)
-        
-        return (channel, command, arg)
+        reply = _ephemeral_reply("Working on running *{} {}* right now for you".format(command, arg))
+        return (reply, (channel, command, arg))
 
-    elif action['value'] == "False":
-        # user canceled
-        callback_url = slack_message['response_url']
-        slack.respond_to_url(callback_url,
-            "Ok, nevermind!",
-            ephemeral=True)
+    # user canceled
+    return (_ephemeral_reply("Ok, nevermind!"), None)
 
-        raise UserWarning("User canceled the action")
\ No newline at end of file
+def _ephemeral_reply(text):
+    return {
+        "response_type": "ephemeral",
+        "replace_original": True,
+        "text": text,
+    }
@@ -0,0 +1,63 @@
+'''
+Archives (or unarchives) projects in bulk, ie: at the end of the year
+
+usage: python manage.py archive_projects --through-id 1234 [--type P] [--unarchive] [--dry-run]
+       python manage.py archive_projects --id 12 --id 15
+'''
+from django.core.management.base import BaseCommand, CommandError
+
+from lucid_api.models import Project
+
+
+class Command(BaseCommand):
+    help = "Archives projects and their service connections with bulk updates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--id',
+            type=int,
+            action='append',
+            dest='ids',
+            help="Project id to include. Can be given more than once",
+        )
+        parser.add_argument(
+            '--through-id',
+            type=int,
+            help="Include every project up to and including this id",
+        )
+        parser.add_argument(
+            '--type',
+            dest='type_code',
+            help="Only include projects of this type code, ie: P",
+        )
+        parser.add_argument(
+            '--unarchive',
+            action='store_true',
+            help="Unarchive the projects instead",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only count the projects that would change",
+        )
+
+    def handle(self, *args, **options):
+        if not options['ids'] and options['through_id'] is None:
+            raise CommandError("Give projects with --id or --through-id")
+
+        projects = Project.objects.all()
+        if options['ids']:
+            projects = projects.filter(id__in=options['ids'])
+        if options['through_id'] is not None:
+            projects = projects.filter(id__lte=options['through_id'])
+        if options['type_code']:
+            projects = projects.filter(type_code_id=options['type_code'].upper())
+
+        verb = "unarchive" if options['unarchive'] else "archive"
+        if options['dry_run']:
+            count = projects.filter(is_archived=options['unarchive']).count()
+            self.stdout.write("Would {} {} project(s)".format(verb, count))
+            return
+
+        count = projects.unarchive() if options['unarchive'] else projects.archive()
+        self.stdout.write("{}d {} project(s)".format(verb.capitalize(), count))
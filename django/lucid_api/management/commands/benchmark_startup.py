@@ -0,0 +1,76 @@
+'''
+Startup benchmark for the service layer
+
+Times django.setup() in fresh interpreters, once as the app starts now (service
+SDKs load on demand) and once with every service module imported up front,
+which is what importing lucid_api.models used to cost.
+
+usage: python manage.py benchmark_startup --runs 5
+'''
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+_SETUP = '''
+import time
+start = time.time()
+import django
+django.setup()
+{extra}
+print(time.time() - start)
+'''
+
+_EAGER_IMPORTS = '''
+from lucid_api import services
+for service_name in services.__all__:
+    services.get_service_module(service_name)
+'''
+
+
+class Command(BaseCommand):
+    help = "Compares startup import time with lazy and eager loading of the service SDKs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help="Number of fresh interpreters to time per scenario",
+        )
+
+    def handle(self, *args, **options):
+        runs = options['runs']
+        if runs < 1:
+            raise CommandError("--runs must be at least 1")
+
+        scenarios = (
+            ("before: eager service SDK imports", _SETUP.format(extra=_EAGER_IMPORTS)),
+            ("after: lazy service SDK imports", _SETUP.format(extra="")),
+        )
+
+        results = {}
+        for label, code in scenarios:
+            timings = sorted(self._time(code) for _ in range(runs))
+            results[label] = timings
+            self.stdout.write("{:<36} min {:7.3f}s  median {:7.3f}s  max {:7.3f}s".format(
+                label, timings[0], timings[len(timings) // 2], timings[-1]))
+
+        before = results[scenarios[0][0]][0]
+        after = results[scenarios[1][0]][0]
+        self.stdout.write("Saved {:.3f}s ({:.0f}%) per process start".format(
+            before - after, 100.0 * (before - after) / before if before else 0))
+
+    def _time(self, code):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'lucidcontrol.settings')
+
+        output = subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=env,
+        )
+        # django or the sdks may log on stdout, the timing is the last line
+        return float(output.strip().splitlines()[-1])
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 13:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lucid_api', '0002_auto_20190212_1823'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='project',
+            name='is_archived',
+            field=models.BooleanField(db_index=True, default=False, help_text='This will automatically archive all connected services.', verbose_name='Archived'),
+        ),
+        migrations.AlterField(
+            model_name='serviceconnection',
+            name='service_name',
+            field=models.CharField(choices=[(b'dropbox_service', b'Dropbox'), (b'ftrack_service', b'ftrack'), (b'groups_service', b'Google Groups'), (b'lucille_service', b'Lucille Service'), (b'slack_service', b'Slack'), (b'xero_service', b'Xero')], db_index=True, max_length=200, verbose_name='Service Name'),
+        ),
+    ]
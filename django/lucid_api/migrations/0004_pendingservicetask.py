@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 13:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lucid_api', '0003_project_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingServiceTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=20)),
+                ('revision', models.PositiveIntegerField(default=1)),
+                ('queued', models.DateTimeField(auto_now=True)),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_tasks', to='lucid_api.ServiceConnection')),
+            ],
+            options={
+                'verbose_name': 'Pending Service Task',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendingservicetask',
+            unique_together=set([('connection', 'action')]),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 14:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lucid_api', '0004_pendingservicetask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderHealth',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_name', models.CharField(choices=[(b'dropbox_service', b'Dropbox'), (b'ftrack_service', b'ftrack'), (b'groups_service', b'Google Groups'), (b'lucille_service', b'Lucille Service'), (b'slack_service', b'Slack'), (b'xero_service', b'Xero')], max_length=200, unique=True, verbose_name='Service Name')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='Failures In A Row')),
+                ('paused_until', models.DateTimeField(blank=True, null=True, verbose_name='Paused Until')),
+                ('last_error', models.CharField(blank=True, default='', max_length=1000, verbose_name='Last Error')),
+            ],
+            options={
+                'verbose_name': 'Provider Health',
+                'verbose_name_plural': 'Provider Health',
+            },
+        ),
+    ]
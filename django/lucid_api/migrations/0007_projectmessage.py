@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 14:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lucid_api', '0006_ratelimitbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField()),
+                ('is_action', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_messages', to='lucid_api.Project')),
+            ],
+            options={
+                'verbose_name': 'Project Message',
+                'ordering': ('id',),
+            },
+        ),
+    ]
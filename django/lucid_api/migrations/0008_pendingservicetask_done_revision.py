@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.9 on 2026-10-18 19:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lucid_api', '0007_projectmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingservicetask',
+            name='done_revision',
+            field=models.PositiveIntegerField(default=0, help_text='the last revision that finished'),
+        ),
+    ]
@@ -1,33 +1,77 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import datetime
 
 from django.db.models.signals import post_init
 from django.dispatch import receiver
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.conf import settings
+from django.utils import timezone
 
 import services
+from .services.registry import registry
+from .services.cache import TTLCache
 
-# get the list of services
-SERVICE_LIST = []
-for service_class in services.__all__:
-    # get the class instance to get the pretty name
-    service = getattr(services, service_class)
-    SERVICE_LIST.append((service_class, service.Service._pretty_name))
-
-SERVICE_LIST = sorted(SERVICE_LIST)
+# get the list of services from the static manifest, so no SDKs are imported here
+SERVICE_LIST = sorted(services.SERVICES)
 
 
 class DirtyFieldsMixin(object):
-    def __init__(self, *args, **kwargs):
-        super(DirtyFieldsMixin, self).__init__(*args, **kwargs)
-        self._original_state = self._as_dict()
-
-    def _as_dict(self):
-        return dict([(f.name, getattr(self, f.name)) for f in self._meta.local_fields if not f.rel])
+    '''
+    tracks changes to the fields listed in _dirty_tracked_fields, for the signals.
+
+    nothing is copied when an instance is loaded, the row the database returned
+    is kept as it is and only looked at when get_dirty_fields() is called, so
+    loading thousands of rows for a list doesn't pay for it.
+    '''
+    _dirty_tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(DirtyFieldsMixin, cls).from_db(db, field_names, values)
+        instance._loaded_values = (field_names, values)
+        return instance
+
+    def save(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).save(*args, **kwargs)
+        self._reset_dirty_state(kwargs.get('update_fields'))
+
+    def get_dirty_fields(self, update_fields=None):
+        '''
+        returns the tracked fields that changed since the instance was loaded
+        (or last saved) as {field name: original value}
 
-    def get_dirty_fields(self):
-        new_state = self._as_dict()
-        return dict([(key, value) for key, value in self._original_state.iteritems() if value != new_state[key]])
+        ### Args:
+        - **update_fields**: only look at these fields, ie: the update_fields
+        a post_save signal was given
+        '''
+        original = self._original_state()
+        dirty = {}
+        for name, attname in self._tracked_attnames(update_fields):
+            # fields that weren't loaded (deferred) can't have changed
+            if attname in original and original[attname] != getattr(self, attname):
+                dirty[name] = original[attname]
+        return dirty
+
+    def _original_state(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            # a new instance has nothing to compare against
+            return {}
+        return dict(zip(*loaded))
+
+    def _reset_dirty_state(self, update_fields=None):
+        state = self._original_state()
+        for _, attname in self._tracked_attnames(update_fields):
+            if attname in self.__dict__:
+                state[attname] = getattr(self, attname)
+        self._loaded_values = (list(state.keys()), list(state.values()))
+
+    def _tracked_attnames(self, update_fields=None):
+        for name in self._dirty_tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if update_fields is None or name in update_fields or attname in update_fields:
+                yield name, attname
 
 # Create your models here.
 
@@ -63,8 +107,91 @@ class ProjectType(models.Model):
         verbose_name = "Project Type"
 
 
+class ProjectQuerySet(models.QuerySet):
+    '''
+    bulk archive and unarchive, for when saving projects one at a time is too slow
+    '''
+
+    def archive(self):
+        '''
+        archives every project in the queryset and its service connections
+
+        ### Returns:
+        the number of projects that were archived
+        '''
+        return self._set_archived(True)
+
+    def unarchive(self):
+        '''
+        unarchives every project in the queryset and its service connections
+
+        ### Returns:
+        the number of projects that were unarchived
+        '''
+        return self._set_archived(False)
+
+    def _set_archived(self, is_archived):
+        with transaction.atomic():
+            project_ids = list(self.exclude(is_archived=is_archived).values_list('id', flat=True))
+            if not project_ids:
+                return 0
+
+            # queryset updates skip the project signals, the connections are
+            # handled here in bulk instead
+            Project.objects.filter(id__in=project_ids).update(is_archived=is_archived)
+            ServiceConnection.objects.filter(project_id__in=project_ids)._set_archived(is_archived)
+
+        return len(project_ids)
+
+
+class ServiceConnectionQuerySet(models.QuerySet):
+    '''
+    bulk archive and unarchive, sending the service tasks as one dispatch
+    '''
+
+    def archive(self):
+        '''
+        archives every connection in the queryset in its service
+
+        ### Returns:
+        the number of connections that were archived
+        '''
+        return self._set_archived(True)
+
+    def unarchive(self):
+        '''
+        unarchives every connection in the queryset in its service
+
+        ### Returns:
+        the number of connections that were unarchived
+        '''
+        return self._set_archived(False)
+
+    def _set_archived(self, is_archived):
+        # tasks imports the models, so it can't be imported at the top
+        from .tasks import ServiceAction, dispatch_service_tasks
+
+        with transaction.atomic():
+            changing = list(self.exclude(is_archived=is_archived).values_list('id', 'identifier'))
+            if not changing:
+                return 0
+
+            ServiceConnection.objects.filter(
+                id__in=[connection_id for connection_id, _ in changing]
+            ).update(is_archived=is_archived)
+
+            # a connection without an identifier was never created in its service
+            dispatch_service_tasks(
+                ServiceAction.ARCHIVE if is_archived else ServiceAction.UNARCHIVE,
+                [connection_id for connection_id, identifier in changing if identifier])
+
+        return len(changing)
+
+
 class Project(DirtyFieldsMixin, models.Model):
     ''' Lucid project '''
+    # the fields the signals act on when they change (see signals)
+    _dirty_tracked_fields = ('title', 'type_code', 'is_archived')
 
     type_code = models.ForeignKey(
         ProjectType,
@@ -78,12 +205,35 @@ class Project(DirtyFieldsMixin, models.Model):
     is_archived = models.BooleanField(
         verbose_name="Archived",
         help_text="This will automatically archive all connected services.",
-        default=False
+        default=False,
+        db_index=True,
     )
 
+    objects = ProjectQuerySet.as_manager()
+
     def __str__(self):
         return "{self.type_code.chr}-{self.id:04d} {self.title}".format(self=self)
 
+    def apply_template(self):
+        '''
+        creates this project's service connections from the template project,
+        in one query. bulk_create skips the ServiceConnection signals, so the
+        caller is responsible for dispatching the create tasks.
+
+        ### Returns:
+        list of the new *ServiceConnection*s
+        '''
+        connections = [
+            ServiceConnection(project=self, **template_connection)
+            for template_connection in TemplateProject.get_connections()
+        ]
+        created = ServiceConnection.objects.bulk_create(connections)
+
+        if created and created[0].pk is None:
+            # only postgres hands back the new ids from a bulk insert
+            created = list(self.services.order_by('id'))
+        return created
+
     def message(self, message, **kwargs):
         '''used by celery tasks to send messages to the project.
 
@@ -99,6 +249,8 @@ class Project(DirtyFieldsMixin, models.Model):
 
 class ServiceConnection(DirtyFieldsMixin, models.Model):
     '''service connections to a project'''
+    # the fields the signals act on when they change (see signals)
+    _dirty_tracked_fields = ('connection_name', 'is_archived')
 
     project = models.ForeignKey(
         Project,
@@ -109,7 +261,8 @@ class ServiceConnection(DirtyFieldsMixin, models.Model):
         max_length=200,
         verbose_name="Service Name",
         choices=SERVICE_LIST,
-        blank=False
+        blank=False,
+        db_index=True,
     )
     # connection name is only necessary to disambiguate multiple connections to
     # the same service per project (slack? i dunno, maybe I'm planning too hard)
@@ -140,11 +293,12 @@ class ServiceConnection(DirtyFieldsMixin, models.Model):
         blank=True,
     )
 
+    objects = ServiceConnectionQuerySet.as_manager()
+
     @property
     def service(self):
-        ''' returns an instance of the service class that this connection represents'''
-        service_module = getattr(services, self.service_name)
-        return service_module.Service()
+        ''' returns the worker's shared instance of the service class that this connection represents'''
+        return registry.get(self.service_name)
 
     def send(self, message, **kwargs):
         ''' send a message using this service.
@@ -155,7 +309,11 @@ class ServiceConnection(DirtyFieldsMixin, models.Model):
         if not self.is_messenger:
             raise AttributeError("Not a messenger connection")
 
-        response = self.service.message(self.identifier, message, **kwargs)
+        try:
+            response = self.service.message(self.identifier, message, **kwargs)
+        except Exception as err:
+            registry.report_error(self.service_name, err)
+            raise
 
         return response
 
@@ -166,6 +324,222 @@ class ServiceConnection(DirtyFieldsMixin, models.Model):
         verbose_name = "Service Connection"
 
 
+class ProjectMessage(models.Model):
+    '''
+    a status line waiting to be posted to a project's messenger channels.
+
+    lines that arrive within PROJECT_MESSAGE_WINDOW seconds of each other are
+    sent together as one message (see tasks.queue_project_message)
+    '''
+    project = models.ForeignKey(
+        Project,
+        on_delete=models.CASCADE,
+        related_name="pending_messages",
+    )
+    text = models.TextField()
+    is_action = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return "{s.project_id}: {s.text}".format(s=self)
+
+    class Meta():
+        verbose_name = "Project Message"
+        ordering = ('id',)
+
+
+class PendingServiceTask(models.Model):
+    '''
+    the latest queued service_task for each (connection, action).
+
+    every time a task is queued the revision goes up, and a task only runs if
+    its revision is still the latest. Saving a title five times quickly queues
+    five renames, but only the last one calls the service, and a message that
+    celery delivers twice (acks late) only runs once.
+
+    rows are kept once their task is done, so revisions only ever go up and a
+    late copy of an old message can't match a newer queueing.
+    '''
+    connection = models.ForeignKey(
+        ServiceConnection,
+        on_delete=models.CASCADE,
+        related_name="pending_tasks",
+    )
+    action = models.CharField(max_length=20)
+    revision = models.PositiveIntegerField(default=1)
+    done_revision = models.PositiveIntegerField(
+        default=0,
+        help_text="the last revision that finished",
+    )
+    queued = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{s.action} {s.connection_id} @{s.revision}".format(s=self)
+
+    @classmethod
+    def queue(cls, action, connection_ids):
+        '''
+        bumps the revision for *action* on every connection
+
+        ### Returns:
+        dict of {connection id: revision} to send with the tasks
+        '''
+        connection_ids = set(connection_ids)
+        with transaction.atomic():
+            pending = cls.objects.filter(action=action, connection_id__in=connection_ids)
+            pending.update(revision=models.F('revision') + 1)
+
+            missing = connection_ids.difference(pending.values_list('connection_id', flat=True))
+            if missing:
+                try:
+                    with transaction.atomic():
+                        cls.objects.bulk_create(
+                            cls(action=action, connection_id=connection_id)
+                            for connection_id in missing)
+                except IntegrityError:
+                    # another process queued one of them first, count ours after theirs
+                    pending.filter(connection_id__in=missing).update(revision=models.F('revision') + 1)
+                    for connection_id in missing:
+                        cls.objects.get_or_create(action=action, connection_id=connection_id)
+
+            return dict(pending.values_list('connection_id', 'revision'))
+
+    @classmethod
+    def is_current(cls, action, connection_id, revision):
+        '''
+        whether a task with *revision* is still the one that should run
+        '''
+        return cls.objects.filter(
+            action=action, connection_id=connection_id, revision=revision,
+            done_revision__lt=revision).exists()
+
+    @classmethod
+    def finish(cls, action, connection_id, revision):
+        '''
+        marks the pending task done, unless a newer one was queued while it ran
+        '''
+        cls.objects.filter(
+            action=action, connection_id=connection_id, revision=revision,
+        ).update(done_revision=revision)
+
+    class Meta():
+        verbose_name = "Pending Service Task"
+        unique_together = (('connection', 'action'),)
+
+
+class ProviderHealth(models.Model):
+    '''
+    circuit breaker for each service, shared by every worker.
+
+    after the service's _breaker_threshold failures in a row (or a rate limit)
+    every task for it waits until paused_until, instead of each pending
+    connection retrying against a provider that's down.
+    '''
+    service_name = models.CharField(
+        max_length=200,
+        verbose_name="Service Name",
+        choices=SERVICE_LIST,
+        unique=True,
+    )
+    failures = models.PositiveIntegerField(
+        verbose_name="Failures In A Row",
+        default=0,
+    )
+    paused_until = models.DateTimeField(
+        verbose_name="Paused Until",
+        null=True,
+        blank=True,
+    )
+    last_error = models.CharField(
+        verbose_name="Last Error",
+        max_length=1000,
+        default="",
+        blank=True,
+    )
+
+    def __str__(self):
+        return "{s.service_name}: {s.failures} failure(s)".format(s=self)
+
+    @classmethod
+    def paused_for(cls, service_name):
+        '''
+        ### Returns:
+        seconds until *service_name* can be called again, 0 if it's healthy
+        '''
+        now = timezone.now()
+        paused_until = cls.objects.filter(
+            service_name=service_name, paused_until__gt=now
+        ).values_list('paused_until', flat=True).first()
+
+        if paused_until is None:
+            return 0
+        return (paused_until - now).total_seconds()
+
+    @classmethod
+    def record_failure(cls, service_name, err, threshold, cooldown):
+        '''
+        counts a failure, opening the breaker for *cooldown* seconds once there
+        have been *threshold* in a row
+
+        ### Returns:
+        **True** if the breaker is open
+        '''
+        with transaction.atomic():
+            health, _ = cls.objects.select_for_update().get_or_create(service_name=service_name)
+            health.failures += 1
+            health.last_error = "{}".format(err)[:1000]
+            if health.failures >= threshold:
+                health._pause(cooldown)
+            health.save()
+        return health.failures >= threshold
+
+    @classmethod
+    def pause(cls, service_name, seconds, err=None):
+        '''
+        holds every task for *service_name* for *seconds*, ie: when it rate limits us
+        '''
+        with transaction.atomic():
+            health, _ = cls.objects.select_for_update().get_or_create(service_name=service_name)
+            if err is not None:
+                health.last_error = "{}".format(err)[:1000]
+            health._pause(seconds)
+            health.save()
+
+    @classmethod
+    def record_success(cls, service_name):
+        '''
+        closes the breaker. A no-op update while the service is healthy
+        '''
+        cls.objects.filter(service_name=service_name, failures__gt=0).update(
+            failures=0, paused_until=None)
+
+    def _pause(self, seconds):
+        until = timezone.now() + datetime.timedelta(seconds=seconds)
+        if self.paused_until is None or self.paused_until < until:
+            self.paused_until = until
+
+    class Meta():
+        verbose_name = "Provider Health"
+        verbose_name_plural = "Provider Health"
+
+
+class RateLimitBucket(models.Model):
+    '''
+    token bucket for one service api method, shared by every worker (see
+    services.ratelimit)
+    '''
+    key = models.CharField(max_length=200, unique=True)
+    tokens = models.FloatField(default=0)
+    updated = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "{s.key}: {s.tokens:.1f}".format(s=self)
+
+
+# the template barely changes, but every new project needs it
+_template_cache = TTLCache(getattr(settings, 'PROJECT_TEMPLATE_TTL', 300))
+
+
 class TemplateProject(models.Model):
     ''' This model is used to define the template that is used to create new projects'''
 
@@ -174,6 +548,28 @@ class TemplateProject(models.Model):
     def __str__(self):
         return "Template Project"
 
+    @classmethod
+    def get_connections(cls):
+        '''
+        returns the template's connections as a tuple of ServiceConnection
+        field dicts, cached until the template changes (see signals) or
+        PROJECT_TEMPLATE_TTL runs out
+        '''
+        return _template_cache.get('connections', cls._load_connections)
+
+    @classmethod
+    def invalidate_cache(cls):
+        _template_cache.invalidate()
+
+    @classmethod
+    def _load_connections(cls):
+        template = cls.objects.order_by('id').first()
+        if template is None:
+            return ()
+
+        return tuple(template.services.order_by('id').values(
+            'service_name', 'connection_name', 'is_messenger'))
+
 
 class TemplateServiceConnection(models.Model):
     template = models.ForeignKey(
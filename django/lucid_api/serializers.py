@@ -1,5 +1,7 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import ProjectType, Project, ServiceConnection
+from .tasks import ServiceAction, dispatch_service_tasks
 
 class ServiceConnectionSerializer(serializers.ModelSerializer):
     ''' used to create the many to one relation on projects'''
@@ -33,7 +35,16 @@ class ProjectSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         services_data = validated_data.pop('services')
-        project = Project.objects.create(**validated_data)
-        for service_data in services_data:
-            ServiceConnection.objects.create(project=project, **service_data)
-        return project
\ No newline at end of file
+        with transaction.atomic():
+            # saving the project applies the template (see signals)
+            project = Project.objects.create(**validated_data)
+            connections = ServiceConnection.objects.bulk_create(
+                ServiceConnection(project=project, **service_data)
+                for service_data in services_data
+            )
+
+            # connections given an identifier already exist in their service
+            dispatch_service_tasks(
+                ServiceAction.CREATE,
+                [c.id for c in connections if c.identifier == ""])
+        return project
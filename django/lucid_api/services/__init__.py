@@ -1,21 +1,33 @@
-''' 
-lucid services module 
+'''
+lucid services module
+
+all active services must be listed in SERVICES as (module name, pretty name).
+The pretty name has to match the module's Service._pretty_name.
 
-all active services must be imported and added to __all__
+Service modules pull in heavy SDKs (dropbox, ftrack, google, xero...), so they
+are not imported here. Use get_service_module() to load one the first time a
+task actually needs it.
 '''
 
-import dropbox_service
-import ftrack_service
-import groups_service
-import slack_service
-import xero_service
-import lucille_service
-
-__all__ = [
-    "dropbox_service",
-    "ftrack_service",
-    "groups_service",
-    "slack_service",
-    "xero_service",
-    "lucille_service",
-]
+import importlib
+
+SERVICES = (
+    ("dropbox_service", "Dropbox"),
+    ("ftrack_service", "ftrack"),
+    ("groups_service", "Google Groups"),
+    ("slack_service", "Slack"),
+    ("xero_service", "Xero"),
+    ("lucille_service", "Lucille Service"),
+)
+
+__all__ = [service_name for service_name, _ in SERVICES]
+
+
+def get_service_module(service_name):
+    '''
+    imports (once) and returns the module for *service_name*, ie: *slack_service*
+    '''
+    if service_name not in __all__:
+        raise ImportError("{} is not an active service".format(service_name))
+
+    return importlib.import_module('.{}'.format(service_name), __name__)
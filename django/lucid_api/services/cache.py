@@ -0,0 +1,50 @@
+'''
+Small in-process cache for service lookups
+
+Service instances live for the life of a worker process (see registry), so
+lookups that rarely change (employee lists, schemas...) can be kept on the
+instance for a while instead of asking the remote api on every task.
+'''
+
+import time
+import threading
+
+
+class TTLCache(object):
+    '''
+    Thread-safe dict of values that expire *ttl* seconds after they are stored
+    '''
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._values = {}
+
+    def get(self, key, loader):
+        '''
+        returns the cached value for *key*, calling *loader()* to fetch (and
+        store) it when it's missing or expired
+        '''
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None:
+                value, stored = entry
+                if time.time() - stored < self.ttl:
+                    return value
+
+        # load outside the lock, a slow api call shouldn't block other keys
+        value = loader()
+
+        with self._lock:
+            self._values[key] = (value, time.time())
+        return value
+
+    def invalidate(self, key=None):
+        '''
+        drops *key* (or everything if not given)
+        '''
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
@@ -6,6 +6,8 @@ K Bjordahl
 '''
 
 import service_template
+import retry
+from sessions import get_session
 import dropbox
 import simplejson as json
 import os
@@ -33,7 +35,11 @@ class Service(service_template.ServiceTemplate):
         self._logger = get_task_logger(__name__)
         self._logger.info("Instantiated Dropbox!")
 
-        self._dbx = dropbox.Dropbox(os.environ.get('DROPBOX_ACCESS_TOKEN'))
+        # the sdk's own session (pinned certificates), kept for the whole worker
+        self._dbx = dropbox.Dropbox(
+            os.environ.get('DROPBOX_ACCESS_TOKEN'),
+            session=get_session('dropbox', dropbox.create_session),
+        )
 
     def create(self, service_connection_id):
         '''
@@ -49,6 +55,7 @@ class Service(service_template.ServiceTemplate):
 
         try:
             # make the folder
+            self._throttle('files/create_folder')
             response = self._dbx.files_create_folder(slug)
             self._logger.debug("Dbx Response: %s", response)
 
@@ -82,10 +89,12 @@ class Service(service_template.ServiceTemplate):
                           project, connection)
 
         try:
+            self._throttle('files/get_metadata')
             meta = self._dbx.files_get_metadata(connection.identifier)
             self._logger.debug("Got Dropbox Metadata: %s", meta)
 
             # move from the current path (via metadata) to the new slug path
+            self._throttle('files/move')
             response = self._dbx.files_move(meta.path_lower, slug)
 
             if response.path_display <> slug:
@@ -131,6 +140,7 @@ class Service(service_template.ServiceTemplate):
         target_folder = slug
         self._logger.debug("Target archive folder is %s", target_folder)
 
+        self._throttle('files/get_metadata')
         meta = self._dbx.files_get_metadata(connection.identifier)
 
         if target_folder in meta.path_display:
@@ -143,6 +153,7 @@ class Service(service_template.ServiceTemplate):
                 "Attempting to move [%s] to [%s]", meta.path_display, target_folder)
 
             try:
+                self._throttle('files/move')
                 response = self._dbx.files_move(
                     meta.path_display, target_folder)
 
@@ -179,11 +190,13 @@ class Service(service_template.ServiceTemplate):
             self._logger.info(
                 "Checking to see if [%s] is empty", project_folder)
 
+            self._throttle('files/list_folder')
             project_folder_contents = self._dbx.files_list_folder(
                 project_folder)
 
             if len(project_folder_contents.entries) == 0:
                 self._logger.info("Project folder is empty, deleting...")
+                self._throttle('files/delete')
                 self._dbx.files_delete(project_folder)
 
                 self._logger.info('Project folder archive complete')
@@ -201,6 +214,27 @@ class Service(service_template.ServiceTemplate):
         '''
         self.archive(service_connection_id)
 
+    def is_credential_error(self, err):
+        '''expired or revoked access tokens come back as an AuthError'''
+        return isinstance(err, dropbox.exceptions.AuthError)
+
+    def classify_error(self, err):
+        '''
+        ApiErrors (path conflicts, missing folders) and bad input won't change
+        by retrying, rate limits pause every dropbox task
+        '''
+        if isinstance(err, dropbox.exceptions.RateLimitError):
+            return retry.THROTTLED
+        if isinstance(err, (dropbox.exceptions.ApiError, dropbox.exceptions.BadInputError)):
+            return retry.FATAL
+        return super(Service, self).classify_error(err)
+
+    def retry_after(self, err):
+        '''dropbox sends its Retry-After on the RateLimitError'''
+        if isinstance(err, dropbox.exceptions.RateLimitError) and err.backoff is not None:
+            return float(err.backoff)
+        return super(Service, self).retry_after(err)
+
     def _format_slug(self, connection,):
         '''Correctly formats  the slug for drobox'''
         # do the default one but replace spaces
@@ -16,6 +16,7 @@ import logging
 import re
 from types import *
 import service_template
+from cache import TTLCache
 
 from django.apps import apps
 from celery.utils.log import get_task_logger
@@ -26,6 +27,10 @@ class Service(service_template.ServiceTemplate):
     _connected = None
     _pretty_name = "ftrack"
 
+    # schemas, scopes, types and users hardly ever change, so their ids are
+    # kept for an hour between lookups
+    _LOOKUP_CACHE_TTL = 60 * 60
+
     def __init__(self, server_url=None, api_key=None, api_user=None, slug_regex=None):
         '''
         Constructor:
@@ -37,6 +42,7 @@ class Service(service_template.ServiceTemplate):
         '''
         
         self._logger = get_task_logger(__name__)
+        self._lookups = TTLCache(self._LOOKUP_CACHE_TTL)
 
         try:
             if server_url is None:
@@ -62,6 +68,14 @@ class Service(service_template.ServiceTemplate):
             self._logger.error("Environment variables may be missing")
             raise e
 
+    @property
+    def session(self):
+        '''
+        the service's ftrack_api.Session, for callers that need to run their own
+        queries (ie: checkin's on-site lookups)
+        '''
+        return self._server
+
     def is_connected(self):
         '''
         returns connection state for testing
@@ -74,6 +88,45 @@ class Service(service_template.ServiceTemplate):
         return self._connected
 
 
+    def is_credential_error(self, err):
+        '''
+        ftrack raises a ServerError for a bad api key or user, and a
+        ConnectionClosedError once the session has been closed
+        '''
+        if isinstance(err, ftrack_api.exception.ConnectionClosedError):
+            return True
+
+        if isinstance(err, ftrack_api.exception.ServerError):
+            error_text = "{}".format(err).lower()
+            return "api key" in error_text or "authenticat" in error_text
+
+        return False
+
+    def invalidate_cache(self, expression=None):
+        '''
+        forget cached lookup ids, e.g. after renaming a scope or type in ftrack
+
+        ### Args:
+        - **expression**: the query expression to forget, or **None** for all of them
+        '''
+        self._lookups.invalidate(expression)
+
+    def _lookup_id(self, expression):
+        '''
+        the id of the one entity matching *expression* (ie: "Scope where name is 'Film'")
+        cached for _LOOKUP_CACHE_TTL.
+
+        ids are the same in every session, so these can be used as
+        foreign keys (project_schema_id, type_id...) from a user's session too
+
+        ### Raises:
+        ftrack_api.exception.NotFoundError or MultipleResultsFoundError, misses aren't cached
+        '''
+        return self._lookups.get(
+            expression,
+            lambda: self._server.query('select id from {}'.format(expression)).one()['id']
+        )
+
     def create(self, service_connection_id):
         '''
         creates a new ftrack project
@@ -95,19 +148,21 @@ class Service(service_template.ServiceTemplate):
 
 
         try:
-            lucid_schema = self._server.query(
-                'ProjectSchema where name is "{}"'.format(default_schema_name)).one()
+            schema_id = self._lookup_id(
+                'ProjectSchema where name is "{}"'.format(default_schema_name))
 
             ft_project = self._server.create('Project', {
                 'name': project.id,
                 'full_name': slug,
-                'project_schema': lucid_schema
+                'project_schema_id': schema_id
             })
             self._logger.debug('Created ftrack project for %s - %s (%s)', project, connection, ft_project)
 
             # assign the general project scope
             try:
-                general_scope = self._server.query("Scope where name is '{}'".format(project.type_code.description)).one()
+                scope_id = self._lookup_id("Scope where name is '{}'".format(project.type_code.description))
+                # served from the session cache after the first project
+                general_scope = self._server.get('Scope', scope_id)
                 ft_project['scopes'].append(general_scope)
             except:
                 self._logger.warn("Couldn't assign scope for %s", connection)
@@ -293,38 +348,38 @@ class Service(service_template.ServiceTemplate):
         user_ftrack = ftrack_api.Session(api_user=user_email)
         lead_project_name = os.environ['FTRACK_LEAD_PROJECT']
         try:
-            lead_project = user_ftrack.query("Project where (name like '{name}' or full_name like '{name}')".format(name=lead_project_name)).one()
-            self._logger.debug("Found Lead project, name=%s", lead_project['name'])
+            lead_project_id = self._lookup_id("Project where (name like '{name}' or full_name like '{name}')".format(name=lead_project_name))
+            self._logger.debug("Found Lead project, id=%s", lead_project_id)
             task = {
                 'name': lead_text,
-                'parent': lead_project,
+                'parent_id': lead_project_id,
                 }
         except ftrack_api.exception.NotFoundError as err:
             self._logger.error("Couldn't find project named %s (%s)", lead_project_name, err.message)
             raise FtrackServiceError("Couldn't find ftrack project {}. _Check Env variables...({})_".format(lead_project_name, err.message))
         
         try:
-            task['type'] = user_ftrack.query("Type where name like '%Slack'").one()
-            self._logger.debug("Found Slack task type %s", task['type']['name'])
+            task['type_id'] = self._lookup_id("Type where name like '%Slack'")
+            self._logger.debug("Found Slack task type %s", task['type_id'])
         except: 
             self._logger.warn("Couldn't find Slack task type, going with Generic")
-            task['type'] = user_ftrack.query("Type where name like '%Generic%'").one()
+            task['type_id'] = self._lookup_id("Type where name like '%Generic%'")
                 
         self._logger.debug("Running ftrack.create for %s",task)
         lead_task = user_ftrack.create("Task", task)
 
         try:
-            user = user_ftrack.query("User where email is '{}'".format(user_email)).one()
-            self._logger.debug("Found User %s:%s",user['first_name'], user['email'])
+            user_id = self._lookup_id("User where email is '{}'".format(user_email))
+            self._logger.debug("Found User %s:%s", user_id, user_email)
         except:
             self._logger.error("Couldn't find user for email %s", user_email)
             raise FtrackServiceError("Could not find user with email {}".format(user_email))
         else:
-            self._logger.debug("Creating assignment of %s to task %s", user['email'], lead_task['name'])
+            self._logger.debug("Creating assignment of %s to task %s", user_email, lead_task['name'])
             try:
                 appt = user_ftrack.create("Appointment", {
-                    'context': lead_task,
-                    'resource': user,
+                    'context_id': lead_task['id'],
+                    'resource_id': user_id,
                     'type': 'assignment'
                 })
 
@@ -341,7 +396,7 @@ class Service(service_template.ServiceTemplate):
 
                 # make a link for the new lead
                 url = "{base}#slideEntityId={task_id}&slideEntityType=task&view=tasks&itemId=projects&entityId={project_id}&entityType=show".format(
-                    task_id=lead_task['id'], project_id=lead_project['id'], base=os.environ['FTRACK_SERVER']
+                    task_id=lead_task['id'], project_id=lead_project_id, base=os.environ['FTRACK_SERVER']
                 )
                 self._logger.debug("Url=[%s]", url)
                 return url
@@ -8,11 +8,15 @@ JT
 '''
 
 import service_template
+import retry
+from cache import TTLCache
 import httplib2, json
 import os
 import re
 from apiclient import discovery, errors
+from apiclient.http import BatchHttpRequest
 from oauth2client.service_account import ServiceAccountCredentials
+from oauth2client.client import AccessTokenRefreshError
 
 from django.apps import apps
 from celery.utils.log import get_task_logger
@@ -22,6 +26,15 @@ class Service(service_template.ServiceTemplate):
     _DEFAULT_REGEX = re.compile(r'^(?P<typecode>[A-Z])-(?P<project_id>\d{4})')
     _DEFAULT_FORMAT = "{typecode}-{project_id:04d}-{connection_name}"
     _pretty_name = "Google Groups"
+    _EMPLOYEES_GROUP = 'employees@lucid.rocks'
+    # the employee list barely changes, and the service instance is shared
+    # by every task in the worker (see registry)
+    _EMPLOYEE_CACHE_TTL = 15 * 60
+    # google accepts up to 1000 calls per batch, but the directory api
+    # throttles big batches, so keep them modest
+    _MEMBER_BATCH_SIZE = 50
+    # the global batch endpoint is gone, each api has its own
+    _ADMIN_BATCH_URI = 'https://www.googleapis.com/batch/admin/directory_v1'
    
     def __init__(self):
         '''
@@ -31,14 +44,13 @@ class Service(service_template.ServiceTemplate):
         self._logger = get_task_logger(__name__)
         self._admin = self._create_admin_service()
         self._group = self._create_groupsettings_service()
+        self._employee_cache = TTLCache(self._EMPLOYEE_CACHE_TTL)
 
     def create(self, service_connection_id):
         '''
         Creates Google Groups Group and adds necessary users to it.
         '''
 
-        group = self._admin.groups()
-        grp_settings = self._group.groups()
         ServiceConnection = apps.get_model("lucid_api", "ServiceConnection")
         connection = ServiceConnection.objects.get(pk=service_connection_id)
         project = connection.project
@@ -64,9 +76,35 @@ class Service(service_template.ServiceTemplate):
             "isArchived" : "true", # We want to keep all the great messages
         }
 
+        if connection.identifier:
+            # a retry of a create that failed adding members, the group is already there
+            self._logger.info("Group %s already exists for %s, adding its members",
+                connection.identifier, connection)
+            grp_info['email'] = connection.identifier
+
+        else:
+            self._insert_group(connection, grp_info, dir_info)
+
+        # don't add users for test projects
+        if project.type_code.character_code == "X":
+            return 
+
+        # With the group created, let's add some members.
+        self.add_members(grp_info['email'], self.list_employees())
+
+    def _insert_group(self, connection, grp_info, dir_info):
+        '''
+        makes the group and applies its settings, storing the group's email as the
+        connection's identifier
+        '''
+        group = self._admin.groups()
+        grp_settings = self._group.groups()
+
         try:
             # make the group via google api
+            self._throttle('groups.insert')
             create_response = group.insert(body=grp_info).execute()
+            self._throttle('groupssettings.patch')
             create_settings = grp_settings.patch(groupUniqueId=grp_info['email'], body=dir_info).execute() 
             
             # store the email as the identifier in django
@@ -85,22 +123,46 @@ class Service(service_template.ServiceTemplate):
             else:
                 raise GroupsServiceError(err)
 
-        # With the group created, let's add some members.
-        emp_group = self.list_employees()
+        return 
 
-        # don't add users for test projects
-        if project.type_code.character_code == "X":
-            return 
+    def add_members(self, group_key, emails):
+        '''
+        Adds *emails* to the group, sending the inserts as batch requests
+        instead of one round trip per member. Members that are already in the
+        group (409) are fine.
 
-        try: 
-            for i in emp_group:
-                add_users = self._admin.members().insert(groupKey=grp_info['email'], body=({'email' : i})).execute()
-                self._logger.debug('Added %s to %s', i, grp_info['name']) 
-        except errors.HttpError as err:
-            self._logger.error('Failed try while adding members: {}'.format(err))
-            raise GroupsServiceError('Problem adding members to group!')
+        ### Args:
+        - **group_key**: the group's email address or id
+        - **emails**: list of member email addresses
 
-        return 
+        ### Raises:
+        *GroupsServiceError* if any member couldn't be added
+        '''
+        failed = []
+
+        def _inserted(request_id, response, exception):
+            if exception is None:
+                self._logger.debug('Added %s to %s', request_id, group_key)
+            elif isinstance(exception, errors.HttpError) and exception.resp.status == 409:
+                self._logger.debug('%s is already a member of %s', request_id, group_key)
+            else:
+                self._logger.error('Failed adding %s to %s: %s', request_id, group_key, exception)
+                failed.append(request_id)
+
+        members = self._admin.members()
+        for start in range(0, len(emails), self._MEMBER_BATCH_SIZE):
+            chunk = emails[start:start + self._MEMBER_BATCH_SIZE]
+            batch = BatchHttpRequest(callback=_inserted, batch_uri=self._ADMIN_BATCH_URI)
+            for email in chunk:
+                batch.add(
+                    members.insert(groupKey=group_key, body={'email': email}),
+                    request_id=email)
+            # every call in a batch counts against the quota
+            self._throttle('members.insert', tokens=len(chunk))
+            batch.execute()
+
+        if failed:
+            raise GroupsServiceError('Problem adding members to group! {}'.format(", ".join(failed)))
 
     def rename(self, service_connection_id):
         '''
@@ -129,6 +191,7 @@ class Service(service_template.ServiceTemplate):
 
         # 3. Perform actual rename here. 
         try:
+            self._throttle('groups.patch')
             create_response = self._admin.groups().patch(
                 groupKey=connection.identifier,
                 body=grp_info
@@ -177,6 +240,7 @@ class Service(service_template.ServiceTemplate):
         
         # 2. issue the command to google's api
         try:
+            self._throttle('groupssettings.patch')
             create_settings = grp_settings.patch(
                 groupUniqueId=connection.identifier, 
                 body=dir_info).execute()
@@ -192,6 +256,29 @@ class Service(service_template.ServiceTemplate):
             raise GroupsServiceError("Ack! Can't archive %s: %s", connection, err.message)
         
 
+    def is_credential_error(self, err):
+        '''
+        a delegated token that can't be refreshed, or a 401 from the api
+        '''
+        if isinstance(err, AccessTokenRefreshError):
+            return True
+
+        if isinstance(err, errors.HttpError):
+            return err.resp.status == 401
+
+        return False
+
+    def classify_error(self, err):
+        '''
+        google reports quota errors as a 403 as well as a 429
+        '''
+        if isinstance(err, errors.HttpError) and err.resp.status == 403:
+            if 'rateLimitExceeded' in "{}".format(err.content):
+                return retry.THROTTLED
+            return retry.FATAL
+
+        return super(Service, self).classify_error(err)
+
     def _format_slug(self, connection):
         '''
         Formats the slug based on the connection data.
@@ -286,6 +373,7 @@ class Service(service_template.ServiceTemplate):
         '''
         group = self._admin.groups()
 
+        self._throttle('groups.list')
         response = group.list(customer='my_customer').execute()
 
         # For debugging purposes only
@@ -296,12 +384,29 @@ class Service(service_template.ServiceTemplate):
     def list_employees(self):
         '''
         Get a list of employees (members of the employees@lucid.rocks group)
+
+        cached for _EMPLOYEE_CACHE_TTL seconds
         '''
+        return self._employee_cache.get(self._EMPLOYEES_GROUP, self._fetch_employees)
+
+    def _fetch_employees(self):
         employee = self._admin.members()
-        l = employee.list(groupKey='employees@lucid.rocks').execute()
-        
-        response = [r['email'] for r in l['members']]
-        return response
+        response = []
+        page_token = None
+
+        while True:
+            self._throttle('members.list')
+            l = employee.list(
+                groupKey=self._EMPLOYEES_GROUP,
+                maxResults=200,
+                pageToken=page_token,
+                ).execute()
+
+            response.extend(r['email'] for r in l.get('members', []))
+
+            page_token = l.get('nextPageToken')
+            if not page_token:
+                return response
 
     def _create_admin_service(self):
         scopes = ['https://www.googleapis.com/auth/admin.directory.group']
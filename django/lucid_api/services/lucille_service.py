@@ -14,7 +14,9 @@ import json
 import logging
 
 from django.conf import settings
-from graphqlclient import GraphQLClient
+
+import retry
+from sessions import get_session
 
 from django.apps import apps
 from celery.utils.log import get_task_logger
@@ -69,11 +71,39 @@ class Service(service_template.ServiceTemplate):
         '''
         self._logger = get_task_logger(__name__)
 
-        self._client = GraphQLClient(os.environ.get('LUCILLE_ADDRESS'))
-        self._client.inject_token(os.environ.get('LUCILLE_TOKEN'))
+        self._address = os.environ.get('LUCILLE_ADDRESS')
+        self._token = os.environ.get('LUCILLE_TOKEN')
+        # graphqlclient opens a new connection for every query, post through
+        # the worker's keep-alive session instead
+        self._session = get_session('lucille')
 
         self._logger.info('Instantiated Lucille Service')
 
+    def is_credential_error(self, err):
+        '''
+        a 401 or 403 means the token is bad
+        '''
+        return retry.status_code(err) in (401, 403)
+
+    def _execute(self, query, variables=None):
+        '''
+        sends a graphql query to lucille
+
+        ### Returns:
+        the response body as text
+        '''
+        response = self._session.post(
+            self._address,
+            json={'query': query, 'variables': variables},
+            headers={
+                'Accept': 'application/json',
+                'Authorization': self._token,
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
+        return response.text
+
     def create(self, service_connection_id):
         '''
         Creates project using gql on lucille
@@ -89,7 +119,7 @@ class Service(service_template.ServiceTemplate):
             # send the upsert mutation, with variables subbed in
             self._logger.debug('preparing mutation:\n%s',
                                self._upsert_mutation.format(p=project))
-            result = self._client.execute(
+            result = self._execute(
                 self._upsert_mutation.format(p=project))
 
             # parse the result as json
@@ -121,7 +151,7 @@ class Service(service_template.ServiceTemplate):
             self._logger.debug('preparing mutation:\n%s',
                                self._archive_mutation.format(p=project))
 
-            result = self._client.execute(
+            result = self._execute(
                 self._archive_mutation.format(p=project))
 
             data = json.loads(result)['data']['archiveProject']
@@ -150,7 +180,7 @@ class Service(service_template.ServiceTemplate):
             self._logger.debug('preparing mutation:\n%s',
                                self._unarchive_mutation.format(p=project))
 
-            result = self._client.execute(
+            result = self._execute(
                 self._unarchive_mutation.format(p=project))
 
             data = json.loads(result)['data']['unarchiveProject']
@@ -0,0 +1,93 @@
+'''
+Rate limiter shared by every worker
+
+A token bucket per service and api method, kept in the database
+(RateLimitBucket) so every worker process draws from the same bucket. The
+rates come from settings.SERVICE_RATE_LIMITS:
+
+    SERVICE_RATE_LIMITS = {
+        'slack_service': {
+            'default': (0.8, 10),           # calls per second, burst
+            'channels.create': (0.3, 5),
+        },
+    }
+
+Methods that aren't listed share the service's 'default' bucket. Services
+that aren't listed aren't limited at all.
+'''
+
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+
+def throttle(service_name, method='default', tokens=1):
+    '''
+    waits until *service_name* may call *method* (*tokens* times)
+
+    ### Returns:
+    the seconds spent waiting
+    '''
+    limits = getattr(settings, 'SERVICE_RATE_LIMITS', {}).get(service_name)
+    if not limits:
+        return 0
+
+    if method not in limits:
+        method = 'default'
+        if method not in limits:
+            return 0
+
+    rate, burst = limits[method]
+    waited = take("{}:{}".format(service_name, method), rate, burst, tokens)
+    if waited:
+        logger.debug("Waited %.2fs for %s %s", waited, service_name, method)
+    return waited
+
+
+def take(key, rate, burst, tokens=1):
+    '''
+    takes *tokens* from the bucket *key*, which refills at *rate* per second up
+    to *burst*, sleeping until there are enough.
+
+    The bucket row is only locked while it's read and written, never while
+    sleeping. Don't call this inside a long transaction, the lock would be
+    held until it commits.
+
+    ### Returns:
+    the seconds spent waiting
+    '''
+    RateLimitBucket = apps.get_model("lucid_api", "RateLimitBucket")
+    # a call bigger than the bucket would never fit
+    tokens = min(tokens, burst)
+    waited = 0
+
+    while True:
+        with transaction.atomic():
+            bucket, created = RateLimitBucket.objects.select_for_update().get_or_create(
+                key=key, defaults={'tokens': burst})
+
+            now = timezone.now()
+            if not created:
+                elapsed = max((now - bucket.updated).total_seconds(), 0)
+                bucket.tokens = min(burst, bucket.tokens + elapsed * rate)
+            bucket.updated = now
+
+            if bucket.tokens >= tokens:
+                bucket.tokens -= tokens
+                wait = 0
+            else:
+                wait = (tokens - bucket.tokens) / rate
+
+            bucket.save()
+
+        if not wait:
+            return waited
+
+        time.sleep(wait)
+        waited += wait
@@ -0,0 +1,106 @@
+'''
+Service client registry for Lucid Control
+
+Building a service client is expensive (slack auth.test, xero tracking
+categories, google discovery docs, ftrack schema), so each worker process
+keeps a single instance of every service and hands it out to every task.
+Clients are rebuilt after SERVICE_CLIENT_TTL seconds, or straight away when
+a service reports that its credentials have gone bad.
+'''
+
+import os
+import time
+import threading
+import logging
+
+from django.conf import settings
+
+from . import get_service_module
+
+
+class ServiceRegistry(object):
+    '''
+    Per-process cache of service instances, keyed by service module name
+    (ie: *slack_service*)
+    '''
+
+    def __init__(self, ttl=None):
+        self._logger = logging.getLogger(__name__)
+        self._ttl = ttl
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._pid = os.getpid()
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'SERVICE_CLIENT_TTL', 3600)
+
+    def get(self, service_name):
+        '''
+        returns the shared instance of *service_name*, building it if it
+        doesn't exist yet or has expired
+        '''
+        with self._lock:
+            self._check_fork()
+
+            entry = self._clients.get(service_name)
+            if entry is not None:
+                service, created = entry
+                if self.ttl <= 0 or time.time() - created < self.ttl:
+                    return service
+                self._logger.info("Service client for %s expired, rebuilding", service_name)
+
+            service = self._build(service_name)
+            self._clients[service_name] = (service, time.time())
+            return service
+
+    def invalidate(self, service_name=None):
+        '''
+        drops the cached client for *service_name* (or all clients if not given),
+        so the next call to get() builds a fresh one
+        '''
+        with self._lock:
+            if service_name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(service_name, None)
+        self._logger.info("Invalidated service client(s): %s", service_name or "all")
+
+    def report_error(self, service_name, err):
+        '''
+        lets the registry know a call on *service_name* failed. If the service
+        says it was a credential problem, the client is thrown away.
+
+        ### Returns:
+        **True** if the client was invalidated
+        '''
+        with self._lock:
+            entry = self._clients.get(service_name)
+
+        if entry is None:
+            return False
+
+        service, _ = entry
+        if service.is_credential_error(err):
+            self._logger.warn("Credential error on %s, rebuilding client: %s", service_name, err)
+            self.invalidate(service_name)
+            return True
+
+        return False
+
+    def _build(self, service_name):
+        self._logger.info("Building service client for %s", service_name)
+        return get_service_module(service_name).Service()
+
+    def _check_fork(self):
+        # clients (and their sockets) can't be shared with a forked child,
+        # so a celery prefork child starts with an empty registry
+        pid = os.getpid()
+        if pid != self._pid:
+            self._clients = {}
+            self._pid = pid
+
+
+registry = ServiceRegistry()
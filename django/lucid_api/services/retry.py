@@ -0,0 +1,75 @@
+'''
+Retry helpers for service tasks
+
+Errors from a service are sorted into:
+- RETRY: worth trying again later (timeouts, 5xx, expired credentials...)
+- THROTTLED: the provider asked us to slow down, every task for it should wait
+- FATAL: trying again won't help (name taken, not found, bad request...)
+
+Retries back off exponentially with full jitter, so tasks that failed together
+don't all come back at the same moment.
+'''
+
+import random
+
+
+RETRY = 'retry'
+THROTTLED = 'throttled'
+FATAL = 'fatal'
+
+
+def backoff(retries, base, cap):
+    '''
+    seconds to wait before retry number *retries* (0 based), anywhere between
+    0 and base * 2^retries, but never more than *cap*
+    '''
+    return random.uniform(0, min(cap, base * 2 ** retries))
+
+
+def retry_after(err):
+    '''
+    the seconds a provider asked us to wait in a Retry-After header, if the
+    error carries an http response (requests, urllib2 or httplib2)
+
+    ### Returns:
+    seconds as a float, or **None** if there isn't one
+    '''
+    headers = None
+
+    response = getattr(err, 'response', None)
+    if response is not None:
+        headers = getattr(response, 'headers', None)
+
+    if headers is None:
+        # urllib2.HTTPError
+        headers = getattr(err, 'headers', None)
+
+    if headers is None:
+        # apiclient.errors.HttpError keeps the httplib2 response (a dict) in resp
+        headers = getattr(err, 'resp', None)
+
+    if headers is None:
+        return None
+
+    try:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        # an http-date, or headers we can't read
+        return None
+
+
+def status_code(err):
+    '''
+    the http status on an error from requests, urllib2 or httplib2, if any
+    '''
+    response = getattr(err, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return response.status_code
+
+    resp = getattr(err, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None) is not None:
+        return int(resp.status)
+
+    code = getattr(err, 'code', None)
+    return code if isinstance(code, int) else None
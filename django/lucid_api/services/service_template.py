@@ -13,12 +13,24 @@ import logging
 
 from django.conf import settings
 
+import retry
+import ratelimit
+
 
 class ServiceTemplate(object):
 
     _DEFAULT_REGEX = re.compile(r'^(?P<typecode>[A-Z])-(?P<project_id>\d{4})-(?P<project_title>.+)')
     _DEFAULT_FORMAT = "{typecode}-{project_id:04d}-{title}"
     _pretty_name = "Generic Service"
+
+    # retry policy for service tasks (seconds), override per provider
+    _retry_base = 10
+    _retry_cap = 15 * 60
+    _max_retries = 8
+    # the provider's circuit breaker opens after this many failures in a row,
+    # and holds every task for it for this long
+    _breaker_threshold = 5
+    _breaker_cooldown = 2 * 60
     
 
     def _setup_logger(self, level=settings.LOG_LEVEL_TYPE, to_file=True):
@@ -58,6 +70,57 @@ class ServiceTemplate(object):
     def get_pretty_name(self):
         return self._pretty_name
 
+    def is_credential_error(self, err):
+        '''
+        Whether *err* means this service's credentials (or session) are no longer
+        valid. The service registry rebuilds the client when this returns True.
+
+        Override in services that can tell.
+        '''
+        return False
+
+    def classify_error(self, err):
+        '''
+        Sorts *err* into retry.RETRY, retry.THROTTLED or retry.FATAL, so
+        service tasks know whether to back off, pause the provider or give up.
+
+        Anything unknown is retried. Override in services that know which of
+        their errors won't go away.
+        '''
+        status = retry.status_code(err)
+        if status == 429:
+            return retry.THROTTLED
+        if status in (400, 404, 422):
+            return retry.FATAL
+        return retry.RETRY
+
+    def retry_after(self, err):
+        '''
+        seconds the provider asked us to wait before trying again, or **None**
+        '''
+        return retry.retry_after(err)
+
+    def retry_countdown(self, err, retries):
+        '''
+        seconds to wait before retry number *retries*, honouring the provider's
+        Retry-After if it gave one
+        '''
+        wait = self.retry_after(err)
+        if wait is not None:
+            return wait
+        return retry.backoff(retries, self._retry_base, self._retry_cap)
+
+    def _throttle(self, method='default', tokens=1):
+        '''
+        waits for this service's rate limit (settings.SERVICE_RATE_LIMITS)
+        before calling *method*. Call it right before every api call.
+
+        ### Args:
+        - **method**: the provider's api method, ie: *chat.postMessage*
+        - **tokens**: how many calls this counts as (ie: a batch request)
+        '''
+        return ratelimit.throttle(self.__module__.rsplit('.', 1)[-1], method, tokens)
+
     def get_link(self, project_id):
         return ""
 
@@ -0,0 +1,71 @@
+'''
+Keep-alive HTTP sessions for service clients
+
+Every worker process keeps one requests session per provider, so calls reuse
+open TLS connections instead of handshaking again for every task. Slacker
+clients are kept per token on top of the shared slack session.
+'''
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# connections kept open per host, enough for the threads a task starts
+POOL_MAXSIZE = 10
+
+_lock = threading.RLock()
+_sessions = {}
+_slackers = {}
+_pid = os.getpid()
+
+
+def get_session(name, factory=None):
+    '''
+    returns the process-wide session for *name* (ie: *slack*), creating it
+    with *factory()* (or a plain pooled requests.Session) the first time
+    '''
+    with _lock:
+        _check_fork()
+
+        session = _sessions.get(name)
+        if session is None:
+            session = factory() if factory is not None else _pooled_session()
+            _sessions[name] = session
+        return session
+
+
+def get_slacker(token):
+    '''
+    returns a slacker client for *token* that shares the slack session
+    '''
+    import slacker
+
+    with _lock:
+        _check_fork()
+
+        client = _slackers.get(token)
+        if client is None:
+            client = slacker.Slacker(token, session=get_session('slack'))
+            _slackers[token] = client
+        return client
+
+
+def _pooled_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _check_fork():
+    # sockets can't be shared with a forked child, so a celery prefork child
+    # opens its own connections
+    global _pid
+    pid = os.getpid()
+    if pid != _pid:
+        _sessions.clear()
+        _slackers.clear()
+        _pid = pid
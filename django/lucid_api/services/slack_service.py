@@ -6,12 +6,14 @@ K Bjordahl
 '''
 
 import service_template
+import retry
 import slacker
-import requests.sessions
+from sessions import get_slacker
 import os
 import re
 import simplejson as json
 import logging
+from multiprocessing.pool import ThreadPool
 
 from django.apps import apps
 from celery.utils.log import get_task_logger
@@ -23,6 +25,15 @@ class Service(service_template.ServiceTemplate):
     _DEFAULT_FORMAT = "{project_id:d}-{connection_name}-{title}"
     _pretty_name = "Slack"
 
+    # slack api errors that mean our tokens are no good anymore
+    _CREDENTIAL_ERRORS = ('invalid_auth', 'not_authed', 'account_inactive', 'token_revoked', 'token_expired')
+    # slack api errors that won't go away by trying again
+    _FATAL_ERRORS = ('name_taken', 'invalid_name', 'channel_not_found', 'is_archived',
+                     'already_archived', 'not_archived', 'user_not_found', 'not_in_channel')
+
+    # slack is quick to answer and quick to recover
+    _retry_base = 5
+
     def __init__(self, team_token=None, bot_token=None):
         '''
         Creates the necessary slacker sessions, using env vars if kwargs are not supplied
@@ -34,10 +45,12 @@ class Service(service_template.ServiceTemplate):
         if bot_token is None: bot_token = os.environ.get("SLACK_APP_BOT_TOKEN")
         if team_token is None: team_token = os.environ.get("SLACK_APP_TEAM_TOKEN")
 
-        self._slack_bot = slacker.Slacker(bot_token)
-        self._slack_team = slacker.Slacker(team_token)
+        # keep-alive clients shared with the rest of the worker
+        self._slack_bot = get_slacker(bot_token)
+        self._slack_team = get_slacker(team_token)
 
         # get user info for the slack bot
+        self._throttle('auth.test')
         self._bot_info = self._slack_bot.auth.test().body
 
         # self._logger = self._setup_logger(to_file=False)
@@ -62,60 +75,69 @@ class Service(service_template.ServiceTemplate):
         
         slug = self._format_slug(connection)
 
-        try: 
-            # create the channel first
-            create_response = self._slack_team.channels.create(name=slug)
-            channel = create_response.body['channel']
+        if connection.identifier:
+            # a retry of a create whose invites failed, the channel is already there
+            self._logger.info("Channel %s already exists for %s, finishing its invites",
+                connection.identifier, slug)
+            create_success = True
+            connection.state_message = "Created successfully!"
 
-            create_success = bool(create_response.body['ok'])
-
-            if create_success:
-                self._logger.info("Successfully created channel for %s", slug)
-                connection.state_message = "Created successfully!"
-                connection.identifier = channel['id']
-            else:
-                connection.state_message = "Creation issue."
+        else:
+            try: 
+                # create the channel first
+                self._throttle('channels.create')
+                create_response = self._slack_team.channels.create(name=slug)
+                channel = create_response.body['channel']
+
+                create_success = bool(create_response.body['ok'])
+
+                if create_success:
+                    self._logger.info("Successfully created channel for %s", slug)
+                    connection.state_message = "Created successfully!"
+                    connection.identifier = channel['id']
+                else:
+                    connection.state_message = "Creation issue."
+
+                self._logger.debug("Slack Create Response: %s", create_response.body)
+
+
+            except slacker.Error as err:
+                if slacker.Error.message == "is_archived":
+                    #we managed to try and make a channel which has the exact name as this one and is archived
+                    self._logger.warn("EDGE CASE: Channel %s exists and is archived", slug)
+                    if len(slug) == 21:
+                        slug = slug[0:-1] + "_"
+                    else: slug += "_"
+
+                    self._logger.debug("Reattempting with slug: %s", slug)
+                    try:
+                        self._throttle('channels.create')
+                        create_response = self._slack_team.channels.create(name=slug)
+                        channel = create_response.body['channel']
+                        self._logger.info("Compromise slug %s success. Channel created", slug)
+                        create_success = bool(create_response.body['ok'])
+
+                    except slacker.Error as err2:
+                        self._logger.error("Another slack error: %s", err2.message)
+                        raise SlackServiceError("Channel {} could not be created (is one already archived?)".format(slug))
+
+                elif slacker.Error.message == "name_taken":
+                    # somehow the channel was already created but we didn't save the id
+                    pass
+
+                # whoops!
+                self._logger.error("Error Creating Slack Channel for project # %s: %s", slug, err)
+                raise SlackServiceError("Could not create channel for #%s, Slack API error: %s", slug, err.message)
+
+        # invite the bot and the usergroup, then write the channel id and
+        # status back in one save, even if the invites fail, so a retry
+        # doesn't try to create the channel again
+        try:
+            self._invite_members(connection)
+            connection.state_message += "\nBot invited successfully."
+            connection.state_message += "\nUsers invited successfully!"
+        finally:
             connection.save()
-
-            self._logger.debug("Slack Create Response: %s", create_response.body)
-
-
-        except slacker.Error as err:
-            if slacker.Error.message == "is_archived":
-                #we managed to try and make a channel which has the exact name as this one and is archived
-                self._logger.warn("EDGE CASE: Channel %s exists and is archived", slug)
-                if len(slug) == 21:
-                    slug = slug[0:-1] + "_"
-                else: slug += "_"
-
-                self._logger.debug("Reattempting with slug: %s", slug)
-                try:
-                    create_response = self._slack_team.channels.create(name=slug)
-                    channel = create_response.body['channel']
-                    self._logger.info("Compromise slug %s success. Channel created", slug)
-                    create_success = bool(create_response.body['ok'])
-
-                except slacker.Error as err2:
-                    self._logger.error("Another slack error: %s", err2.message)
-                    raise SlackServiceError("Channel {} could not be created (is one already archived?)".format(slug))
-
-            elif slacker.Error.message == "name_taken":
-                # somehow the channel was already created but we didn't save the id
-                pass
-
-            # whoops!
-            self._logger.error("Error Creating Slack Channel for project # %s: %s", slug, err)
-            raise SlackServiceError("Could not create channel for #%s, Slack API error: %s", slug, err.message)
-
-        # invite the bot
-        self._invite_bot(connection)
-        connection.state_message += "\nBot invited successfully."
-        connection.save()
-
-        # invite the usergroup
-        self._invite_usergroup(connection)
-        connection.state_message += "\nUsers invited successfully!"
-        connection.save()
                 
         return True
 
@@ -144,6 +166,7 @@ class Service(service_template.ServiceTemplate):
         self._logger.info('Start Rename Slack channel %s to %s',connection.connection_name, new_slug)
 
         try:
+            self._throttle('channels.rename')
             rename_response = self._slack_team.channels.rename(
                 channel=connection.identifier,
                 name=new_slug
@@ -191,6 +214,7 @@ class Service(service_template.ServiceTemplate):
         self._logger.info('Archiving Slack for Channel %s-%s', project, connection.connection_name )
 
         try:
+            self._throttle('channels.archive')
             archive_response = self._slack_team.channels.archive(
                 channel=connection.identifier,
             )
@@ -230,21 +254,19 @@ class Service(service_template.ServiceTemplate):
         self._logger.info('Unarchiving Slack for Channel %s', connection.connection_name )
 
         try:
+            self._throttle('channels.unarchive')
             archive_response = self._slack_team.channels.unarchive(
                 channel=connection.identifier,
             )
             connection.state_message = "Unarchived Successfully!"
-            connection.save()
 
-            # invite the bot
-            self._invite_bot(connection)
-            connection.state_message += "\nBot re-invited successfully."
-            connection.save()
-
-            # invite the usergroup
-            self._invite_usergroup(connection)
-            connection.state_message += "\nUsers re-invited successfully!"
-            connection.save()
+            # invite the bot and the usergroup, and save the status once
+            try:
+                self._invite_members(connection)
+                connection.state_message += "\nBot re-invited successfully."
+                connection.state_message += "\nUsers re-invited successfully!"
+            finally:
+                connection.save()
 
             self._logger.info("Finished Unarchive Slack for %s",connection)
         
@@ -285,10 +307,12 @@ class Service(service_template.ServiceTemplate):
                 channel_id, text, attachments)
             
             if action:
+                self._throttle('chat.meMessage')
                 post_response = self._slack_bot.chat.me_message(
                     channel_id, text,
                 )
             else:
+                self._throttle('chat.postMessage')
                 post_response = self._slack_bot.chat.post_message(
                     channel=channel_id,
                     text=text,
@@ -304,6 +328,7 @@ class Service(service_template.ServiceTemplate):
             self._logger.debug("Posted to slack. Response: %s", post_response)
             if pinned and post_response.body['ok']:
                 self._logger.debug("Attempting to pin ts=%s", post_response.body['ts'] )
+                self._throttle('pins.add')
                 pin_response = self._slack_bot.pins.add(
                     channel=channel_id,
                     timestamp=post_response.body['ts']
@@ -333,6 +358,7 @@ class Service(service_template.ServiceTemplate):
 
         try:
             self._logger.debug("In channel %s, searching for matches to %s in pins", channel_id, old_text_stub)
+            self._throttle('pins.list')
             pin_list = self._slack_team.pins.list(channel_id).body
             old_ts = ""
             for pin in pin_list['items']:
@@ -341,6 +367,7 @@ class Service(service_template.ServiceTemplate):
                     old_ts = pin['message']['ts']
                     self._logger.debug("Found matching pinned message ts=%s", old_ts)
 
+                    self._throttle('chat.update')
                     update_response = self._slack_bot.chat.update(
                         channel['id'],
                         old_ts,
@@ -365,6 +392,7 @@ class Service(service_template.ServiceTemplate):
         '''basic slack post
         slack_channel_id: 
         '''
+        self._throttle('chat.postMessage')
         response = self._slack_bot.chat.post_message(
             slack_channel_id,
             text,
@@ -400,6 +428,32 @@ class Service(service_template.ServiceTemplate):
         else:
             raise SlackServiceError("Slack returned an error: {}".format(response.contents))
 
+    def _invite_members(self, connection):
+        '''
+        invites the bot and the usergroup to the connection's channel at the same time.
+        Both invites only need the channel id, so there's no reason to wait for one
+        before sending the other.
+
+        ### Raises:
+        *services.slack_service.**SlackServiceError***: if either invite fails
+        '''
+        # the rate limit tokens are taken here, so the threads never touch the database
+        self._throttle('channels.invite')
+        self._throttle('usergroups.update')
+
+        pool = ThreadPool(2)
+        try:
+            invites = [
+                pool.apply_async(self._invite_bot, (connection,)),
+                pool.apply_async(self._invite_usergroup, (connection,)),
+            ]
+            # get() re-raises any error from the invite
+            for invite in invites:
+                invite.get()
+        finally:
+            pool.close()
+            pool.join()
+
     def _invite_bot(self, connection):
         try:
             #invite the bot user
@@ -503,6 +557,7 @@ class Service(service_template.ServiceTemplate):
     def get_user(self, user_id):
         '''gets a user's info based on slack id'''
         try:
+            self._throttle('users.info')
             user = self._slack_team.users.info(user_id).body['user']
             return user
         except Exception as err:
@@ -528,6 +583,30 @@ class Service(service_template.ServiceTemplate):
         
     #     raise SlackServiceError("Couldn't find slack channel for project # %s", project_id)
 
+    def is_credential_error(self, err):
+        '''
+        slack reports bad tokens as an error string, which we usually wrap in a SlackServiceError
+        '''
+        if not isinstance(err, (slacker.Error, SlackServiceError)):
+            return False
+
+        error_text = repr(err.args)
+        return any(code in error_text for code in self._CREDENTIAL_ERRORS)
+
+    def classify_error(self, err):
+        '''
+        slack api errors come back as an error string (often wrapped in a
+        SlackServiceError), rate limits as an http 429
+        '''
+        if isinstance(err, (slacker.Error, SlackServiceError)):
+            error_text = repr(err.args)
+            if 'ratelimited' in error_text:
+                return retry.THROTTLED
+            if any(code in error_text for code in self._FATAL_ERRORS):
+                return retry.FATAL
+
+        return super(Service, self).classify_error(err)
+
     def _format_slug(self, connection):
         '''
         Makes a slack specific slug
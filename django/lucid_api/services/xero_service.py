@@ -8,9 +8,11 @@ K. Bjordahl
 
 from xero import Xero 
 from xero.auth import PrivateCredentials
+from xero.exceptions import XeroUnauthorized, XeroRateLimitExceeded, XeroBadRequest, XeroNotFound
 import logging
 import re
 import service_template 
+import retry
 import os
 
 from django.apps import apps
@@ -22,6 +24,9 @@ class Service(service_template.ServiceTemplate):
 
     _pretty_name = "Xero"
 
+    # xero allows 60 calls a minute, so give it room
+    _retry_base = 30
+
     def __init__(self, slug_regex=None):
         '''
         Creates and connects to a new Xero instance
@@ -54,6 +59,7 @@ class Service(service_template.ServiceTemplate):
    
         try:
             # create the tracking category
+            self._throttle('TrackingCategories')
             response = self._xero.TCShow.options.put({'Name': slug})
 
             # update the DB
@@ -87,6 +93,7 @@ class Service(service_template.ServiceTemplate):
         new_slug = self._format_slug(project_id, new_title)
 
         try:
+            self._throttle('TrackingCategories')
             response = self._xero.TCShow.options.save({'TrackingOptionID': option['TrackingOptionID'], 'Name': new_slug})
             self._logger.info("Finished renaming Xero Tracking Category %s :: %s", new_slug, response)
         except Exception as e:
@@ -109,6 +116,7 @@ class Service(service_template.ServiceTemplate):
         self._logger.info("Attempting to archive Xero category for #%s", project)
 
         try:
+            self._throttle('TrackingCategories')
             response = self._xero.TCShow.options.delete(connection.identifier)[0]
             success = (response['IsArchived'] or response['IsDeleted']) and not response['IsActive']
             # update db
@@ -121,6 +129,17 @@ class Service(service_template.ServiceTemplate):
 
     def get_link(self, project_id):
         return ""
+
+    def is_credential_error(self, err):
+        '''xero raises XeroUnauthorized for a bad consumer key or expired token'''
+        return isinstance(err, XeroUnauthorized)
+
+    def classify_error(self, err):
+        if isinstance(err, XeroRateLimitExceeded):
+            return retry.THROTTLED
+        if isinstance(err, (XeroBadRequest, XeroNotFound)):
+            return retry.FATAL
+        return super(Service, self).classify_error(err)
         
     
 class XeroServiceError(service_template.ServiceException):
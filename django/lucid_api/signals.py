@@ -4,17 +4,18 @@ signals for automating things on the back end of the api
 
 handles :
 - creating template project connections
+- clearing the cached template when it changes
 - service level interactions from the ServiceConnection model
 '''
 from __future__ import unicode_literals
 import logging
 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.db import transaction
 
-from .models import Project, ServiceConnection, TemplateProject
-from .tasks import service_task, ServiceAction
+from .models import Project, ServiceConnection, TemplateProject, TemplateServiceConnection
+from .tasks import ServiceAction, dispatch_service_tasks
 
 logger = logging.getLogger(__name__)
 logger.info("Setting up signals!")
@@ -43,49 +44,39 @@ def execute_after_save_project(sender, instance, created, raw, using, update_fie
 
         # Template project assembly on new project
         logger.info("Got CREATE signal on %s", instance.title)
-        template = TemplateProject.objects.all()[0]
-        for template_connection in template.services.all():
-            new_service = ServiceConnection(
-                project=instance,
-                service_name=template_connection.service_name,
-                connection_name=template_connection.connection_name,
-                is_messenger=template_connection.is_messenger,
-            )
-            new_service.save()
+        with transaction.atomic():
+            connections = instance.apply_template()
+            # template connections never have an identifier, so they all need creating
+            dispatch_service_tasks(
+                ServiceAction.CREATE,
+                [connection.id for connection in connections])
 
     # catch rename and archive here as well
     else:
         # NOTE: it's possible that a rename and an archive event to happen concurrently
-        changed_fields = instance.get_dirty_fields().keys()
+        changed_fields = instance.get_dirty_fields(update_fields).keys()
         logger.info("Project %s has changed fields: %s",
                     instance, changed_fields)
 
         # RENAME CASE
         if "title" in changed_fields or "type_code" in changed_fields:
             logger.info("Got RENAME signal on %s", instance)
-            # iterate through all services and perform the action
-            for service in instance.services.all():
-                service_task.delay(
-                    ServiceAction.RENAME,
-                    service.id
-                )
+            # one dispatch for all the services, a rename already queued is replaced
+            dispatch_service_tasks(
+                ServiceAction.RENAME,
+                instance.services.values_list('id', flat=True))
 
         # ARCHIVE/UNARCHIVE CASE
         if "is_archived" in changed_fields:
             if instance.is_archived:
                 # ARCHIVE CASE
                 logger.info("Got ARCHIVE signal on %s", instance)
-                # iterate through all services and perform the action
-                for service in instance.services.all():
-                    service.is_archived = True
-                    service.save()
+                # one update and one dispatch for all the services
+                instance.services.archive()
             else:
                 # UNARCHIVE CASE
                 logger.info("Got UNARCHIVE signal on %s", instance)
-                # iterate through all services and perform the action
-                for service in instance.services.all():
-                    service.is_archived = False
-                    service.save()
+                instance.services.unarchive()
 
 
 post_save.connect(
@@ -116,49 +107,42 @@ def execute_after_save_service(sender, instance, created, raw, using, update_fie
         # if the identifier has been provided, we don't need to create it
         if instance.identifier == "":
             # send celery the creation task, only after the transaction
-			transaction.on_commit( 
-				lambda: service_task.delay(
-					ServiceAction.CREATE,
-					instance.id
-            	))
+            dispatch_service_tasks(ServiceAction.CREATE, [instance.id])
 
     else:
 
         # check for changes to name and archive state
         # NOTE: it's possible that a rename and an archive event to happen concurrently
-        changed_fields = instance.get_dirty_fields().keys()
+        changed_fields = instance.get_dirty_fields(update_fields).keys()
         logger.info("Project %s has changed fields: %s",
                     instance, changed_fields)
 
         # RENAME CASE
         if "connection_name" in changed_fields:
             logger.info("Got connection RENAME signal on %s", instance)
-            # iterate through all services and perform the action
-            transaction.on_commit( 
-				lambda: service_task.delay(
-					ServiceAction.RENAME,
-					instance.id
-				))
+            dispatch_service_tasks(ServiceAction.RENAME, [instance.id])
 
         # ARCHIVE/UNARCHIVE CASE
         if "is_archived" in changed_fields:
             if instance.is_archived:
                 # ARCHIVE CASE
                 logger.info("Got ARCHIVE signal on %s", instance)
-                # iterate through all services and perform the action
-                transaction.on_commit( 
-					lambda: service_task.delay(
-						ServiceAction.ARCHIVE,
-						instance.id
-					))
+                dispatch_service_tasks(ServiceAction.ARCHIVE, [instance.id])
 
             else:
                 # UNARCHIVE CASE
                 logger.info("Got UNARCHIVE signal on %s", instance)
-                # iterate through all services and perform the action
-                transaction.on_commit( 
-					lambda: service_task.delay(
-						ServiceAction.UNARCHIVE,
-						instance.id
-					))
+                dispatch_service_tasks(ServiceAction.UNARCHIVE, [instance.id])
     return
+
+
+@receiver(post_save, sender=TemplateProject, dispatch_uid="template_project_saved")
+@receiver(post_delete, sender=TemplateProject, dispatch_uid="template_project_deleted")
+@receiver(post_save, sender=TemplateServiceConnection, dispatch_uid="template_connection_saved")
+@receiver(post_delete, sender=TemplateServiceConnection, dispatch_uid="template_connection_deleted")
+def invalidate_template(sender, instance, *args, **kwargs):
+    '''
+    new projects pick up template changes straight away (in this process)
+    '''
+    logger.info("Template changed, clearing cached template")
+    TemplateProject.invalidate_cache()
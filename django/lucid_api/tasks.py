@@ -1,10 +1,15 @@
 from __future__ import absolute_import, unicode_literals
 import logging
+import random
 
-from celery import shared_task
+from celery import shared_task, group
 from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import transaction
 
-from .models import Project, ServiceConnection, TemplateProject
+from .models import Project, ServiceConnection, TemplateProject, PendingServiceTask, ProviderHealth, ProjectMessage
+from .services.registry import registry
+from .services.retry import FATAL, THROTTLED, backoff, retry_after
 
 class ServiceAction(object):
     CREATE = 'create'
@@ -13,7 +18,7 @@ class ServiceAction(object):
     UNARCHIVE = 'unarchive'
 
 @shared_task(bind=True)
-def service_task(task, action, service_connection_id):
+def service_task(task, action, service_connection_id, revision=None):
     ''' 
     creates an element in a service, based on the service connection. This is just
     a thin wrapper over the individual services, which all handle their own model
@@ -23,18 +28,51 @@ def service_task(task, action, service_connection_id):
     - **action**: a reference to ServiceAction.CREATE, ServiceAction.RENAME or 
     ServiceAction.ARCHIVE
     - **service_connection_id**: the primary key of the service connection to act on
+    - **revision**: the PendingServiceTask revision this task was queued with. If
+    a newer task has been queued for the same action, this one does nothing.
     '''
     logger = get_task_logger(__name__)
 
+    if revision is not None and not PendingServiceTask.is_current(action, service_connection_id, revision):
+        logger.info("Skipping %s on service_connection_id %s, it was superseded or already done",
+                    action, service_connection_id)
+        return
+
     connection = ServiceConnection.objects.get(pk=service_connection_id)
-    service = connection.service
     logger.info("Got service task %s on service_connection_id %s", action, connection)
 
     # if we don't have an identifier, we can't do anything but create
     if connection.identifier == "" and action <> ServiceAction.CREATE:
-        logger.error("Cannot run %s for %s - NO IDENTIFIER on connection")
+        logger.error("Cannot run %s for %s - NO IDENTIFIER on connection", action, connection)
         return
 
+    # the connection may have moved on since the task was queued. A create that
+    # already has an identifier is only done if this is a fresh delivery, retries
+    # come back to finish the steps after it (invites, members...)
+    if ((action == ServiceAction.CREATE and connection.identifier != "" and not task.request.retries)
+            or (action == ServiceAction.ARCHIVE and not connection.is_archived)
+            or (action == ServiceAction.UNARCHIVE and connection.is_archived)):
+        logger.info("Skipping %s on %s, it's already in that state", action, connection)
+        if revision is not None:
+            PendingServiceTask.finish(action, service_connection_id, revision)
+        return
+
+    # hold everything for a provider that's down or rate limiting us, spread
+    # out a little so the held tasks don't all come back at once
+    paused_for = ProviderHealth.paused_for(connection.service_name)
+    if paused_for:
+        logger.warn("%s is paused for %ds, holding %s on %s",
+                    connection.service_name, paused_for, action, connection)
+        task.apply_async(
+            args=task.request.args,
+            kwargs=task.request.kwargs,
+            # keep counting retries, a held retry isn't a fresh delivery
+            retries=task.request.retries,
+            countdown=paused_for + random.uniform(0, min(paused_for, 60)))
+        return
+
+    service = connection.service
+
     try:
         if action == ServiceAction.CREATE:
             service.create(service_connection_id)
@@ -45,8 +83,9 @@ def service_task(task, action, service_connection_id):
         elif action == ServiceAction.UNARCHIVE:
             service.unarchive(service_connection_id)
         
-        message_project.delay(
-            int(connection.project.id),
+        # the other services' results for the project go out in the same message
+        queue_project_message(
+            connection.project_id,
             "*{action}d* {connection}".format(action=action, connection=connection), 
             action=True
             )
@@ -54,8 +93,12 @@ def service_task(task, action, service_connection_id):
     except Exception as err:
         logger.error("Error with %s on %s.", action, connection, exc_info=True)
 
+        # bad credentials get a fresh client on the retry
+        registry.report_error(connection.service_name, err)
+
+        # only write the status, the service may already have saved a new identifier
         connection.state_message = "Error while attempting to {}:\n{}".format(action, err)
-        connection.save()
+        connection.save(update_fields=['state_message'])
         
         # project = connection.project
         # message_project.delay(
@@ -71,12 +114,56 @@ def service_task(task, action, service_connection_id):
         #     action=True
         # )
 
-        task.retry(exc=err, countdown=10)
+        error_kind = service.classify_error(err)
+        if error_kind == FATAL:
+            # trying again won't help, the state message tells people what happened
+            logger.error("Not retrying %s on %s", action, connection)
+            if revision is not None:
+                PendingServiceTask.finish(action, service_connection_id, revision)
+            raise
+
+        countdown = service.retry_countdown(err, task.request.retries)
+        if error_kind == THROTTLED:
+            ProviderHealth.pause(connection.service_name, countdown, err)
+        else:
+            ProviderHealth.record_failure(
+                connection.service_name, err,
+                service._breaker_threshold, service._breaker_cooldown)
+
+        task.retry(exc=err, countdown=countdown, max_retries=service._max_retries)
 
     else:
         # TODO: send success message!
-        
-        pass 
+        ProviderHealth.record_success(connection.service_name)
+        if revision is not None:
+            PendingServiceTask.finish(action, service_connection_id, revision)
+
+
+def dispatch_service_tasks(action, service_connection_ids):
+    '''
+    sends one celery group running *action* on every connection, once the
+    current transaction commits (straight away if there isn't one).
+
+    Each task carries a PendingServiceTask revision, so queueing the same
+    action on a connection again supersedes the task that's already waiting.
+
+    ### Args:
+    - **action**: a ServiceAction
+    - **service_connection_ids**: primary keys of the service connections to act on
+    '''
+    service_connection_ids = list(service_connection_ids)
+    if not service_connection_ids:
+        return
+
+    def _send():
+        revisions = PendingServiceTask.queue(action, service_connection_ids)
+        group(
+            service_task.s(action, service_connection_id, revision=revision)
+            for service_connection_id, revision in revisions.items()
+        ).apply_async()
+
+    transaction.on_commit(_send)
+
 @shared_task
 def execute_slash_command(command, arg, channel):
     '''
@@ -145,7 +232,67 @@ def message_project(task, project_id, message_text, action=False, attachments=No
             # we can't solve this, so bail
             return
         else:
-            task.retry(err=err, countdown=15)
+            countdown = retry_after(err)
+            if countdown is None:
+                countdown = backoff(task.request.retries, 15, 5 * 60)
+            task.retry(exc=err, countdown=countdown)
+
+def queue_project_message(project_id, message_text, action=False):
+    '''
+    buffers a status line for the project's messenger channels. Lines queued
+    within PROJECT_MESSAGE_WINDOW seconds of the first are sent as one message
+    by a single flush_project_messages task.
+
+    ### Args:
+    - **project_id**: the project to message
+    - **message_text**: the line to send
+    - **action**: send as a /me message
+    '''
+    with transaction.atomic():
+        # the project row serializes the check below with the flush
+        list(Project.objects.select_for_update().filter(pk=project_id).values_list('id'))
+
+        flush_pending = ProjectMessage.objects.filter(project_id=project_id).exists()
+        ProjectMessage.objects.create(project_id=project_id, text=message_text, is_action=action)
+
+        if not flush_pending:
+            transaction.on_commit(lambda: flush_project_messages.apply_async(
+                (project_id,),
+                countdown=getattr(settings, 'PROJECT_MESSAGE_WINDOW', 5)))
+
+@shared_task
+def flush_project_messages(project_id):
+    '''
+    sends every buffered line for the project, one message per kind (action
+    or plain). A message that fails is handed to message_project, which retries.
+    '''
+    logger = get_task_logger(__name__)
+
+    with transaction.atomic():
+        list(Project.objects.select_for_update().filter(pk=project_id).values_list('id'))
+        messages = list(ProjectMessage.objects.filter(project_id=project_id))
+        ProjectMessage.objects.filter(id__in=[m.id for m in messages]).delete()
+
+    if not messages:
+        return
+
+    project = Project.objects.get(pk=project_id)
+    logger.info("Messaging %s with %d line(s)", project, len(messages))
+
+    for is_action in (True, False):
+        lines = [m.text for m in messages if m.is_action == is_action]
+        if not lines:
+            continue
+
+        message_text = "\n".join(lines)
+        try:
+            project.message(message_text, action=is_action)
+        except Exception:
+            logger.warn("Batched message failed, handing it to message_project", exc_info=True)
+            message_project.apply_async(
+                (project_id, message_text),
+                {'action': is_action},
+                countdown=backoff(0, 15, 5 * 60))
 
 # create task
 
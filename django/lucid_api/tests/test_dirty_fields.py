@@ -0,0 +1,36 @@
+'''
+tests for the dirty field tracking the project signals rely on
+'''
+
+import pytest
+
+from lucid_api.models import Project, ProjectType
+
+
+@pytest.fixture
+def project(db):
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    Project.objects.bulk_create([Project(title="Dirty Test")])
+    return Project.objects.get()
+
+
+def test_tracks_only_listed_fields(project):
+    assert project.get_dirty_fields() == {}
+
+    project.title = "Renamed"
+    project.type_code_id = "X"
+    assert project.get_dirty_fields() == {'title': "Dirty Test", 'type_code': "P"}
+
+
+def test_respects_update_fields(project):
+    project.title = "Renamed"
+    project.is_archived = True
+
+    assert project.get_dirty_fields(update_fields=['is_archived']) == {'is_archived': False}
+
+
+def test_clean_after_save(project):
+    project.title = "Renamed"
+    project.save(update_fields=['title'])
+
+    assert project.get_dirty_fields() == {}
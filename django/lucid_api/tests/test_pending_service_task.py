@@ -0,0 +1,79 @@
+'''
+tests for collapsing queued service tasks
+'''
+
+import pytest
+
+from lucid_api.models import PendingServiceTask, Project, ProjectType, ServiceConnection
+from lucid_api.tasks import service_task
+
+
+class FakeService(object):
+    def __init__(self):
+        self.created = []
+
+    def create(self, service_connection_id):
+        self.created.append(service_connection_id)
+
+
+@pytest.fixture
+def connections(db):
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    # bulk_create skips the save signals, so no service tasks get queued
+    Project.objects.bulk_create([Project(title="Pending Test")])
+    project = Project.objects.get()
+    ServiceConnection.objects.bulk_create(
+        ServiceConnection(project=project, service_name=service_name, identifier="x")
+        for service_name in ('slack_service', 'dropbox_service'))
+    return list(project.services.values_list('id', flat=True))
+
+
+@pytest.fixture
+def fake_service(monkeypatch):
+    service = FakeService()
+    monkeypatch.setattr(ServiceConnection, 'service', property(lambda self: service))
+    return service
+
+
+def test_only_latest_rename_is_current(connections):
+    first = PendingServiceTask.queue('rename', connections)
+    second = PendingServiceTask.queue('rename', connections[:1])
+
+    assert not PendingServiceTask.is_current('rename', connections[0], first[connections[0]])
+    assert PendingServiceTask.is_current('rename', connections[0], second[connections[0]])
+    # the other connection wasn't queued again
+    assert PendingServiceTask.is_current('rename', connections[1], first[connections[1]])
+
+
+def test_finished_task_doesnt_run_again(connections):
+    revision = PendingServiceTask.queue('archive', connections[:1])[connections[0]]
+    PendingServiceTask.finish('archive', connections[0], revision)
+
+    assert not PendingServiceTask.is_current('archive', connections[0], revision)
+
+
+@pytest.mark.parametrize('retries, resumed', [(0, False), (1, True)])
+def test_create_with_identifier_only_resumes_on_retry(connections, fake_service, retries, resumed):
+    '''
+    a fresh create for a connection that has an identifier is a duplicate, but a
+    retry has to finish what the first attempt left (invites, members...)
+    '''
+    revision = PendingServiceTask.queue('create', connections[:1])[connections[0]]
+    service_task.apply(('create', connections[0]), {'revision': revision}, retries=retries)
+
+    assert (fake_service.created == connections[:1]) == resumed
+    assert not PendingServiceTask.is_current('create', connections[0], revision)
+
+
+def test_old_revision_stays_stale_after_finish(connections):
+    '''
+    finishing keeps the revision counting up, so a late copy of the first message
+    doesn't match the next queueing
+    '''
+    first = PendingServiceTask.queue('rename', connections[:1])[connections[0]]
+    PendingServiceTask.finish('rename', connections[0], first)
+    second = PendingServiceTask.queue('rename', connections[:1])[connections[0]]
+
+    assert second > first
+    assert not PendingServiceTask.is_current('rename', connections[0], first)
+    assert PendingServiceTask.is_current('rename', connections[0], second)
@@ -0,0 +1,46 @@
+'''
+tests for archiving projects in bulk
+'''
+
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from lucid_api.models import Project, ProjectType, ServiceConnection
+
+
+@pytest.fixture
+def projects(db):
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    # bulk_create skips the save signals, so no service tasks get queued
+    Project.objects.bulk_create(Project(title="Project {}".format(i)) for i in range(10))
+    ServiceConnection.objects.bulk_create(
+        ServiceConnection(project=project, service_name='slack_service', identifier="C{}".format(project.id))
+        for project in Project.objects.all())
+    return Project.objects.all()
+
+
+def test_archive_and_unarchive(projects):
+    assert projects.archive() == 10
+    assert not Project.objects.filter(is_archived=False).exists()
+    assert not ServiceConnection.objects.filter(is_archived=False).exists()
+
+    # already archived projects are left alone
+    assert projects.archive() == 0
+
+    assert projects.filter(id__lte=projects.order_by('id')[4].id).unarchive() == 5
+    assert ServiceConnection.objects.filter(is_archived=False).count() == 5
+
+
+def test_archive_query_count_is_constant(projects):
+    '''
+    archiving doesn't touch the rows one at a time
+    '''
+    def archive_queries(queryset):
+        with CaptureQueriesContext(connection) as queries:
+            queryset.archive()
+        return len(queries)
+
+    first_two = list(projects.values_list('id', flat=True)[:2])
+    assert archive_queries(projects.filter(id__in=first_two)) == archive_queries(projects)
@@ -0,0 +1,63 @@
+'''
+tests for the project list endpoint
+'''
+
+import pytest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from lucid_api.models import Project, ProjectType, ServiceConnection
+from lucid_api.views import ProjectList
+
+
+@pytest.fixture
+def list_projects(db):
+    '''
+    returns a function that tops the database up to *count* projects (each
+    with two connections) and returns how many queries listing them took
+    '''
+    user = User.objects.create_superuser('api', 'api@example.com', 'password')
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    view = ProjectList.as_view()
+
+    def list_projects(count, **params):
+        # bulk_create skips the save signals, so no service tasks get queued.
+        # projects are only ever added, deleting them would archive them first
+        Project.objects.bulk_create(
+            Project(title="Project {}".format(i))
+            for i in range(Project.objects.count(), count))
+        ServiceConnection.objects.bulk_create(
+            ServiceConnection(project=project, service_name=service_name)
+            for project in Project.objects.filter(services__isnull=True)
+            for service_name in ('slack_service', 'dropbox_service'))
+
+        request = APIRequestFactory().get('/api/projects/', params)
+        force_authenticate(request, user=user)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request)
+            response.render()
+
+        assert response.status_code == 200
+        assert len(response.data['results']) == min(count, 50)
+        return len(queries)
+
+    return list_projects
+
+
+def test_query_count_is_constant(list_projects):
+    '''
+    listing more projects must not cost more queries
+    '''
+    assert list_projects(5) == list_projects(120)
+
+
+def test_filtered_query_count_is_constant(list_projects):
+    '''
+    the filters don't reintroduce a query per project
+    '''
+    params = {'is_archived': 'false', 'type_code': 'p', 'service_name': 'slack_service'}
+    assert list_projects(5, **params) == list_projects(120, **params)
@@ -0,0 +1,31 @@
+'''
+tests for buffering project status messages
+'''
+
+import pytest
+
+from lucid_api import tasks
+from lucid_api.models import Project, ProjectType
+
+
+@pytest.fixture
+def project(db):
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    Project.objects.bulk_create([Project(title="Message Test")])
+    return Project.objects.get()
+
+
+def test_lines_are_sent_as_one_message(project, monkeypatch):
+    sent = []
+    monkeypatch.setattr(Project, 'message', lambda self, text, **kwargs: sent.append((text, kwargs)))
+
+    tasks.queue_project_message(project.id, "*created* slack", action=True)
+    tasks.queue_project_message(project.id, "*created* dropbox", action=True)
+    tasks.flush_project_messages(project.id)
+
+    assert sent == [("*created* slack\n*created* dropbox", {'action': True})]
+    assert not project.pending_messages.exists()
+
+    # nothing left for a second flush to send
+    tasks.flush_project_messages(project.id)
+    assert len(sent) == 1
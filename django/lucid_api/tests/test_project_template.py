@@ -0,0 +1,43 @@
+'''
+tests for building new projects from the template project
+'''
+
+import pytest
+
+from lucid_api.models import Project, ProjectType, TemplateProject, TemplateServiceConnection
+
+
+@pytest.fixture
+def template(db):
+    ProjectType.objects.get_or_create(character_code="P", defaults={'description': "Project"})
+    template = TemplateProject.objects.create()
+    TemplateServiceConnection.objects.create(
+        template=template, service_name='slack_service', is_messenger=True)
+    TemplateServiceConnection.objects.create(
+        template=template, service_name='dropbox_service')
+    TemplateProject.invalidate_cache()
+    return template
+
+
+def test_new_project_gets_template_connections(template):
+    project = Project.objects.create(title="Template Test")
+
+    services = list(project.services.order_by('id').values_list('service_name', 'is_messenger'))
+    assert services == [('slack_service', True), ('dropbox_service', False)]
+
+
+def test_template_is_cached_until_it_changes(template):
+    '''
+    the template is read once, and saving it clears the cache
+    '''
+    Project.objects.create(title="First")
+
+    # a queryset update skips the signals, so the cached template is used
+    TemplateServiceConnection.objects.filter(service_name='dropbox_service').update(
+        service_name='groups_service')
+    second = Project.objects.create(title="Second")
+    assert second.services.filter(service_name='dropbox_service').exists()
+
+    template.services.get(service_name='groups_service').save()
+    third = Project.objects.create(title="Third")
+    assert third.services.filter(service_name='groups_service').exists()
@@ -0,0 +1,38 @@
+'''
+tests for the in-process service lookup cache
+'''
+
+import pytest
+
+import lucid_api.services.cache as cache_module
+from lucid_api.services.cache import TTLCache
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def test_loads_once_until_expired(now):
+    '''
+    the loader only runs again once the value is older than the ttl
+    '''
+    cache = TTLCache(60)
+    calls = []
+    loader = lambda: calls.append(1) or len(calls)
+
+    assert cache.get('employees', loader) == 1
+    now[0] += 59
+    assert cache.get('employees', loader) == 1
+    now[0] += 2
+    assert cache.get('employees', loader) == 2
+
+
+def test_invalidate(now):
+    cache = TTLCache(60)
+    cache.get('a', lambda: 1)
+    cache.invalidate('a')
+
+    assert cache.get('a', lambda: 2) == 2
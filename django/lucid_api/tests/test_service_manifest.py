@@ -0,0 +1,40 @@
+'''
+tests for the static service manifest
+'''
+
+import sys
+
+import mock
+import pytest
+
+from lucid_api import services
+
+SDK_MODULES = ['dropbox', 'ftrack_api', 'googleapiclient', 'xero', 'graphqlclient']
+
+
+def test_manifest_does_not_import_sdks():
+    '''
+    the manifest alone must not pull in any service sdk
+    '''
+    service_modules = ["lucid_api.services.{}".format(service_name) for service_name in services.__all__]
+
+    # restores sys.modules afterwards, so other tests keep the loaded services
+    with mock.patch.dict(sys.modules):
+        for module_name in list(sys.modules):
+            if module_name.split('.')[0] in SDK_MODULES or module_name in service_modules:
+                del sys.modules[module_name]
+
+        reload(services)
+
+        for module_name in service_modules + SDK_MODULES:
+            assert module_name not in sys.modules
+
+
+@pytest.mark.parametrize("service_name,pretty_name", services.SERVICES)
+def test_manifest_matches_service(service_name, pretty_name):
+    '''
+    the pretty names in the manifest have to match the service classes
+    '''
+    service_module = services.get_service_module(service_name)
+
+    assert service_module.Service._pretty_name == pretty_name
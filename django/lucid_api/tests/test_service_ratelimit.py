@@ -0,0 +1,43 @@
+'''
+tests for the shared service rate limiter
+'''
+
+import datetime
+
+import pytest
+
+import lucid_api.services.ratelimit as ratelimit
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''
+    a fake clock, sleeping moves it forward
+    '''
+    from django.utils import timezone
+
+    now = [timezone.now()]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += datetime.timedelta(seconds=seconds)
+
+    monkeypatch.setattr(ratelimit.timezone, 'now', lambda: now[0])
+    monkeypatch.setattr(ratelimit.time, 'sleep', sleep)
+    return slept
+
+
+@pytest.mark.django_db
+def test_burst_then_waits_for_refill(clock):
+    for _ in range(3):
+        assert ratelimit.take('test:method', rate=2, burst=3) == 0
+
+    assert ratelimit.take('test:method', rate=2, burst=3) == pytest.approx(0.5)
+    assert clock == [pytest.approx(0.5)]
+
+
+def test_unlisted_services_are_not_limited(settings):
+    settings.SERVICE_RATE_LIMITS = {}
+
+    assert ratelimit.throttle('ftrack_service', 'anything') == 0
@@ -0,0 +1,67 @@
+'''
+tests for the per-process service client registry
+'''
+
+import pytest
+
+from lucid_api.services.registry import ServiceRegistry
+
+
+class FakeService(object):
+    ''' stands in for a real service so nothing talks to the outside world '''
+    built = 0
+
+    def __init__(self):
+        FakeService.built += 1
+
+    def is_credential_error(self, err):
+        return isinstance(err, KeyError)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    FakeService.built = 0
+    registry = ServiceRegistry(ttl=60)
+    monkeypatch.setattr(registry, '_build', lambda service_name: FakeService())
+    return registry
+
+
+def test_reuses_client(registry):
+    '''
+    the same instance is handed out until something invalidates it
+    '''
+    first = registry.get('slack_service')
+    second = registry.get('slack_service')
+
+    assert first is second
+    assert FakeService.built == 1
+
+
+def test_rebuilds_after_ttl(registry, monkeypatch):
+    '''
+    an expired client is replaced on the next get
+    '''
+    import lucid_api.services.registry as registry_module
+
+    now = [1000.0]
+    monkeypatch.setattr(registry_module.time, 'time', lambda: now[0])
+
+    first = registry.get('slack_service')
+    now[0] += 61
+    second = registry.get('slack_service')
+
+    assert first is not second
+    assert FakeService.built == 2
+
+
+def test_rebuilds_on_credential_error(registry):
+    '''
+    only credential errors throw the client away
+    '''
+    first = registry.get('slack_service')
+
+    assert not registry.report_error('slack_service', ValueError("nope"))
+    assert registry.get('slack_service') is first
+
+    assert registry.report_error('slack_service', KeyError("invalid_auth"))
+    assert registry.get('slack_service') is not first
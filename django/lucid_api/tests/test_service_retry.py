@@ -0,0 +1,48 @@
+'''
+tests for service task retries and the per provider circuit breaker
+'''
+
+import pytest
+
+from lucid_api.models import ProviderHealth
+from lucid_api.services import retry
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeHTTPError(Exception):
+    def __init__(self, response):
+        super(FakeHTTPError, self).__init__("http error")
+        self.response = response
+
+
+def test_backoff_is_capped_and_jittered():
+    waits = [retry.backoff(retries, 10, 60) for retries in range(10) for _ in range(20)]
+
+    assert all(0 <= wait <= 60 for wait in waits)
+    assert len(set(waits)) > 1
+
+
+def test_retry_after_header():
+    err = FakeHTTPError(FakeResponse(429, {'Retry-After': '30'}))
+
+    assert retry.status_code(err) == 429
+    assert retry.retry_after(err) == 30
+    assert retry.retry_after(ValueError("no response")) is None
+
+
+@pytest.mark.django_db
+def test_breaker_opens_after_threshold_and_closes_on_success():
+    for _ in range(2):
+        assert not ProviderHealth.record_failure('slack_service', ValueError("down"), 3, 60)
+    assert ProviderHealth.paused_for('slack_service') == 0
+
+    assert ProviderHealth.record_failure('slack_service', ValueError("down"), 3, 60)
+    assert 0 < ProviderHealth.paused_for('slack_service') <= 60
+
+    ProviderHealth.record_success('slack_service')
+    assert ProviderHealth.paused_for('slack_service') == 0
@@ -0,0 +1,18 @@
+'''
+tests for the process-wide http sessions
+'''
+
+from lucid_api.services import sessions
+
+
+def test_sessions_are_shared():
+    assert sessions.get_session('test') is sessions.get_session('test')
+    assert sessions.get_session('test') is not sessions.get_session('other')
+
+
+def test_slackers_share_the_slack_session():
+    bot = sessions.get_slacker('xoxb-test')
+
+    assert sessions.get_slacker('xoxb-test') is bot
+    assert sessions.get_slacker('xoxp-test') is not bot
+    assert bot.chat.session is sessions.get_session('slack')
@@ -0,0 +1,36 @@
+'''
+tests for the slash command confirmation messages
+'''
+
+from lucid_api.handlers.slack_handler import confirmation_message, check_confirmation
+
+
+def _action(value):
+    return {
+        'actions': [{'name': "New Project", 'value': value}],
+        'callback_id': 'create',
+        'channel': {'id': 'C123'},
+        'response_url': 'https://hooks.slack.com/actions/nope',
+    }
+
+
+def test_confirmation_is_the_response():
+    message = confirmation_message({'text': "New Project"}, 'create')
+
+    assert message['response_type'] == "ephemeral"
+    assert message['attachments'][0]['callback_id'] == 'create'
+    assert [a['value'] for a in message['attachments'][0]['actions']] == ["True", "False"]
+
+
+def test_confirmed():
+    reply, confirmed = check_confirmation(_action("True"))
+
+    assert confirmed == ('C123', 'create', "New Project")
+    assert reply['replace_original']
+
+
+def test_canceled():
+    reply, confirmed = check_confirmation(_action("False"))
+
+    assert confirmed is None
+    assert reply['text'] == "Ok, nevermind!"
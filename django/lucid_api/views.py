@@ -8,12 +8,13 @@ from django.http import Http404
 from django.http.response import JsonResponse, HttpResponse
 from rest_framework import generics, permissions
 from rest_framework.views import APIView
+from rest_framework.pagination import CursorPagination
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.reverse import reverse_lazy
-from .models import Project
+from .models import Project, ServiceConnection
 from .serializers import ProjectSerializer
-from .handlers.slack_handler import send_confirmation, check_confirmation
+from .handlers.slack_handler import confirmation_message, check_confirmation
 from .tasks import execute_slash_command
 
 ######################
@@ -31,13 +32,58 @@ def api_root(request, format=None):
         'projects': reverse_lazy('api:project_list', request=request, format=format),
     })
 
+class ProjectPagination(CursorPagination):
+    '''
+    newest projects first. A cursor stays cheap however deep the client pages,
+    where an offset would have the database count through every archived project
+    '''
+    ordering = '-id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
 class ProjectList(generics.ListCreateAPIView):
-    queryset = Project.objects.all()
+    '''
+    Lists projects, newest first
+
+    ### Query Params:
+    - **is_archived**: *true* or *false*
+    - **type_code**: project type character code, ie: *P*
+    - **service_name**: only projects with a connection to this service, ie: *slack_service*
+    - **cursor** / **page_size**: pagination
+    '''
+    # the serializer nests type_code and services, load them with the page
+    # instead of once per project
+    queryset = Project.objects.select_related('type_code').prefetch_related('services')
     serializer_class = ProjectSerializer
     permission_classes = (permissions.DjangoModelPermissions,)
+    pagination_class = ProjectPagination
+
+    def get_queryset(self):
+        queryset = super(ProjectList, self).get_queryset()
+        params = self.request.query_params
+
+        is_archived = params.get('is_archived')
+        if is_archived is not None:
+            queryset = queryset.filter(
+                is_archived=is_archived.lower() in ('true', '1', 'yes'))
+
+        type_code = params.get('type_code')
+        if type_code:
+            queryset = queryset.filter(type_code_id=type_code.upper())
+
+        service_name = params.get('service_name')
+        if service_name:
+            # a subquery rather than a join, so a project with several
+            # connections to the service is only listed once
+            queryset = queryset.filter(id__in=ServiceConnection.objects.filter(
+                service_name=service_name).values('project_id'))
+
+        return queryset
 
 class ProjectDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Project.objects.all()
+    queryset = Project.objects.select_related('type_code').prefetch_related('services')
     serializer_class = ProjectSerializer
     permission_classes = (permissions.DjangoModelPermissions,)
 
@@ -47,16 +93,15 @@ class ProjectDetail(generics.RetrieveUpdateDestroyAPIView):
 ###########################
 
 def slash_command(request, command):
-    ''' handles the initial slash commands and sends a confirmation'''
+    ''' handles the initial slash commands and replies with a confirmation'''
     try:
         validate_slack(request.POST['token'])
     except InvalidSlackToken as e:
         return HttpResponse(e.message)
     else:
-        # we've validated the command came from our slack
-        send_confirmation(request.POST, command)
-        return HttpResponse("")
-    pass
+        # we've validated the command came from our slack, the confirmation is
+        # the response itself so slack gets it well inside its 3 seconds
+        return JsonResponse(confirmation_message(request.POST, command))
 
 def action_response(request):
     ''' handles all slack action message responses'''
@@ -81,14 +126,17 @@ def action_response(request):
         
         elif "callback_id" in slack_data.keys():
             try:
-                channel_id, command, arg = check_confirmation(slack_data)
+                reply, confirmed = check_confirmation(slack_data)
+            except Exception:
+                logger.warn("Couldn't read the confirmation", exc_info=True)
+                return HttpResponse("")
+
+            if confirmed is not None:
+                channel_id, command, arg = confirmed
                 # send to celery task
                 execute_slash_command.delay(command, arg, channel_id)
 
-            except:
-                pass
-
-            return HttpResponse("")
+            return JsonResponse(reply)
 
 
 def validate_slack(token):
@@ -9,12 +9,15 @@ https://docs.djangoproject.com/en/1.11/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.11/ref/settings/
 """
+# without this, "celery" below is our own lucidcontrol/celery.py on python 2
+from __future__ import absolute_import
 
 import os
 import logging
 import dj_database_url
 
 from kombu import Exchange, Queue
+from celery.schedules import crontab
 
 # heroku check
 IS_HEROKU = os.path.isdir("/app/.heroku")
@@ -207,12 +210,41 @@ BROKER_CONNECTION_TIMEOUT = 10
 
 # Celery configuration
 
-# configure queues, currently we have only one
+# configure queues, split by how long a person is waiting on the result:
+# - interactive: someone just clicked or typed something in slack
+# - default: check-ins and anything not routed
+# - provisioning: creating/renaming/archiving in external services, which can be slow
+# - batch: nightly and bulk jobs
+# a worker listens to the queues in CELERY_WORKER_QUEUES (see run_celery.sh), so
+# interactive work can have workers of its own
 CELERY_DEFAULT_QUEUE = 'default'
 CELERY_QUEUES = (
+    Queue('interactive', Exchange('interactive'), routing_key='interactive'),
     Queue('default', Exchange('default'), routing_key='default'),
+    Queue('provisioning', Exchange('provisioning'), routing_key='provisioning'),
+    Queue('batch', Exchange('batch'), routing_key='batch'),
 )
 
+CELERY_ROUTES = {
+    # slack button clicks and slash commands
+    'checkin.tasks.handle_workday': {'queue': 'interactive', 'routing_key': 'interactive'},
+    # quick, and mustn't wait behind the check-ins it sends
+    'checkin.tasks.dispatch_workday_checkins': {'queue': 'interactive', 'routing_key': 'interactive'},
+    'lucid_api.tasks.execute_slash_command': {'queue': 'interactive', 'routing_key': 'interactive'},
+    'lucid_api.tasks.message_project': {'queue': 'interactive', 'routing_key': 'interactive'},
+    'lucid_api.tasks.flush_project_messages': {'queue': 'interactive', 'routing_key': 'interactive'},
+
+    # external service calls
+    'lucid_api.tasks.service_task': {'queue': 'provisioning', 'routing_key': 'provisioning'},
+
+    # nightly and bulk jobs
+    'checkin.tasks.update_user_timezones': {'queue': 'batch', 'routing_key': 'batch'},
+    'checkin.tasks.warm_dm_channels': {'queue': 'batch', 'routing_key': 'batch'},
+    'checkin.tasks.build_daily_roster': {'queue': 'batch', 'routing_key': 'batch'},
+    'checkin.tasks.issue_flex_day': {'queue': 'batch', 'routing_key': 'batch'},
+    'checkin.tasks.notify_day_off': {'queue': 'batch', 'routing_key': 'batch'},
+}
+
 # Sensible settings for celery
 CELERY_ALWAYS_EAGER = False
 CELERY_ACKS_LATE = True
@@ -241,6 +273,85 @@ CELERY_TIMEZONE = 'UTC'
 CELERY_ENABLE_UTC = True
 CELERYBEAT_SCHEDULER = 'django_celery_beat.schedulers.DatabaseScheduler'
 
+# fixed schedules, the DatabaseScheduler adds these to the periodic tasks
+CELERYBEAT_SCHEDULE = {
+    # one dispatcher sends everyone's check-in, instead of a task per user
+    'dispatch-workday-checkins': {
+        'task': 'checkin.tasks.dispatch_workday_checkins',
+        'schedule': crontab(minute='*'),
+    },
+    # timezones (and DST) move the UTC check-in time
+    'update-user-timezones': {
+        'task': 'checkin.tasks.update_user_timezones',
+        'schedule': crontab(hour=9, minute=30),
+    },
+    # picks up DM channels for new users before their first check-in
+    'warm-dm-channels': {
+        'task': 'checkin.tasks.warm_dm_channels',
+        'schedule': crontab(hour=9, minute=45),
+    },
+    # who is on site, from ftrack, so check-ins don't have to ask. Rebuilt
+    # through the day to pick up changed tasks
+    'build-daily-roster': {
+        'task': 'checkin.tasks.build_daily_roster',
+        'schedule': crontab(minute='*/15'),
+    },
+}
+
+# check-ins are sent in groups, a few seconds apart, to stay under slack's rate limits
+CHECKIN_BATCH_SIZE = int(os.environ.get('CHECKIN_BATCH_SIZE', 20))
+CHECKIN_BATCH_INTERVAL = int(os.environ.get('CHECKIN_BATCH_INTERVAL', 5))
+# how far back a late check-in dispatch catches up on missed minutes
+CHECKIN_CATCH_UP_MINUTES = int(os.environ.get('CHECKIN_CATCH_UP_MINUTES', 180))
+
+# service clients are shared by every task in a worker process and rebuilt
+# after this many seconds (0 keeps them until a credential error)
+SERVICE_CLIENT_TTL = int(os.environ.get('SERVICE_CLIENT_TTL', 3600))
+
+# token buckets shared by every worker (see lucid_api.services.ratelimit), as
+# (calls per second, burst) for each service and api method. Methods that
+# aren't listed share 'default', services that aren't listed aren't limited
+SERVICE_RATE_LIMITS = {
+    'slack_service': {
+        # slack's tier 3, 50+ a minute
+        'default': (0.8, 10),
+        # tier 2, 20+ a minute
+        'channels.create': (0.3, 5),
+        'channels.invite': (0.3, 5),
+        'usergroups.update': (0.3, 5),
+        'pins.add': (0.3, 5),
+        'pins.list': (0.3, 5),
+        'users.list': (0.3, 2),
+        'conversations.list': (0.3, 2),
+        # about one a second, with short bursts
+        'chat.postMessage': (1, 5),
+        'chat.meMessage': (1, 5),
+        # tier 4, 100+ a minute
+        'conversations.open': (1.5, 20),
+    },
+    'groups_service': {
+        'default': (10, 50),
+    },
+    'dropbox_service': {
+        'default': (5, 10),
+    },
+    'xero_service': {
+        # 60 a minute
+        'default': (1, 5),
+    },
+}
+
+# status lines for a project that arrive within this many seconds of each
+# other are posted as one slack message
+PROJECT_MESSAGE_WINDOW = int(os.environ.get('PROJECT_MESSAGE_WINDOW', 5))
+
+# the project template is cached per process, saving it clears the cache in
+# that process and other processes pick it up after this many seconds
+PROJECT_TEMPLATE_TTL = int(os.environ.get('PROJECT_TEMPLATE_TTL', 300))
+
+# same for the active check-in options (WorkdayOption)
+WORKDAY_OPTION_TTL = int(os.environ.get('WORKDAY_OPTION_TTL', 300))
+
 # logging
 
 LOG_LEVEL = str(os.environ.get('LOG_LEVEL', "info"))
@@ -7,4 +7,8 @@
 cd /app/django  
 # run Celery worker for our project myproject with Celery configuration stored in Celeryconf
 # su -m myuser -c "celery worker -A myproject.celeryconf -Q default -n default@%h"
-su -m myuser -c "celery -A lucidcontrol worker -l debug --without-gossip --without-mingle --without-heartbeat"
\ No newline at end of file
+# CELERY_WORKER_QUEUES picks the worker profile, ie: "interactive" for a worker that
+# only handles slack clicks and commands (see CELERY_QUEUES in settings)
+QUEUES=${CELERY_WORKER_QUEUES:-interactive,default,provisioning,batch}
+NAME=${CELERY_WORKER_NAME:-default}
+su -m myuser -c "celery -A lucidcontrol worker -l debug -Q $QUEUES -n $NAME@%h --without-gossip --without-mingle --without-heartbeat"
\ No newline at end of file
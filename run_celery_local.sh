@@ -7,4 +7,4 @@
 cd ./django  
 # run Celery worker for our project myproject with Celery configuration stored in Celeryconf
 # su -m myuser -c "celery worker -A myproject.celeryconf -Q default -n default@%h"
-celery -A lucidcontrol worker -l debug --without-gossip --without-mingle --without-heartbeat
\ No newline at end of file
+celery -A lucidcontrol worker -l debug -Q ${CELERY_WORKER_QUEUES:-interactive,default,provisioning,batch} --without-gossip --without-mingle --without-heartbeat
\ No newline at end of file
@@ -7,4 +7,4 @@ sleep 10
 cd /app/django  
 # run Celery worker for our project myproject with Celery configuration stored in Celeryconf
 # su -m myuser -c "celery worker -A myproject.celeryconf -Q default -n default@%h"
-celery -A lucidcontrol worker -l info --beat -n default@%h --without-gossip --without-mingle --without-heartbeat
\ No newline at end of file
+celery -A lucidcontrol worker -l info --beat -Q ${CELERY_WORKER_QUEUES:-interactive,default,provisioning,batch} -n default@%h --without-gossip --without-mingle --without-heartbeat
\ No newline at end of file